@@ -0,0 +1,98 @@
+import argparse
+import json
+import re
+import sys
+import timeit
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from zillow import extract  # noqa: E402
+
+"""
+Micro-benchmark of embedded JSON extraction, regex + json.loads vs zillow.extract
+>>> python benchmarks/bench_extract.py --pages ./data/pages
+>>> python benchmarks/bench_extract.py --size 5
+pages are saved html files, e.g. `curl ... > ./data/pages/search-43085.html`
+without --pages synthetic search/building/homedetails pages of --size MB are generated
+"""
+
+"""previous regex extraction"""
+
+
+def regex_search_results(page: str):
+    return json.loads(re.search(r'!--(\{"queryState".*?)-->', page).group(1))
+
+
+def regex_building(page: str):
+    data = json.loads(re.search(r'(\{"props":.*?)</script>', page).group(1))
+    return data.get("props").get("initialData").get("building")
+
+
+def regex_property_details(page: str):
+    raw = json.loads(re.search(r'(\{"apiCache".*?)</script>', page).group(1))
+    cache = json.loads(raw.get('apiCache'))
+    return cache.get(list(cache.keys())[1]).get('property')
+
+
+PAGE_TYPES = {
+    "search": (extract.SEARCH_RESULTS[0], regex_search_results, extract.search_results),
+    "building": (extract.BUILDING[0], regex_building, extract.building),
+    "property": (extract.PROPERTY[0], regex_property_details, extract.property_details),
+}
+
+"""sample pages"""
+
+
+def synthetic_pages(size_mb: float):
+    filler = "<div class='x'>" + "lorem ipsum " * 200 + "</div>\n"
+    padding = filler * max(1, int(size_mb * 1024 * 1024 / 2 / len(filler)))
+    listing = {"zpid": "1", "detailUrl": "/homedetails/1_zpid/", "hdpData": {"homeInfo": {"price": 1}},
+               "carouselPhotos": [{"url": "https://photos.zillowstatic.com/x.jpg"}] * 20}
+    search = {"queryState": {"pagination": {"currentPage": 1}},
+              "cat1": {"searchList": {"totalPages": 1, "totalResultCount": 40},
+                       "searchResults": {"listResults": [listing] * 40}}}
+    unit = {"zpid": "2", "unitNumber": "1A"}
+    building = {"props": {"initialData": {"building": {"zpid": "3", "floorPlans": [{"units": [unit] * 50}] * 10}}}}
+    photos = [{"url": "https://photos.zillowstatic.com/x.jpg", "width": 1536}] * 500
+    api_cache = {"VariantQuery": {}, "FullRenderQuery": {"property": {"zpid": 2, "price": 1000, "photos": photos}}}
+    return {
+        "search": f"<html>{padding}<!--{json.dumps(search)}-->{padding}</html>",
+        "building": f"<html>{padding}<script>{json.dumps(building)}</script>{padding}</html>",
+        "property": f"<html>{padding}<script>{json.dumps({'apiCache': json.dumps(api_cache)})}</script>"
+                    f"{padding}</html>",
+    }
+
+
+def saved_pages(directory: str):
+    pages = {}
+    for file in sorted(Path(directory).glob("*.html")):
+        content = file.read_bytes()
+        for page_type, (marker, _, _) in PAGE_TYPES.items():
+            if marker in content:
+                pages[f"{page_type}:{file.name}"] = content.decode()
+                break
+    return pages
+
+
+def run(pages: dict, number: int):
+    print(f"json backend: {extract.JSON_BACKEND}")
+    print(f"{'page':<40} {'size MB':>8} {'regex ms':>10} {'extract ms':>11} {'speedup':>8}")
+    for name, text in pages.items():
+        _, regex_func, extract_func = PAGE_TYPES[name.split(":")[0]]
+        content = text.encode()
+        assert regex_func(text) == extract_func(content), f"extraction differs for {name}"
+        # best of 5 rounds, regex needs decoded text, extract works on the raw response body
+        regex_ms = min(timeit.repeat(lambda: regex_func(text), number=number, repeat=5)) / number * 1000
+        extract_ms = min(timeit.repeat(lambda: extract_func(content), number=number, repeat=5)) / number * 1000
+        print(f"{name:<40} {len(content) / 1024 / 1024:>8.2f} {regex_ms:>10.2f} {extract_ms:>11.2f} "
+              f"{regex_ms / extract_ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="embedded JSON extraction benchmark")
+    parser.add_argument("--pages", help="directory of saved zillow .html pages")
+    parser.add_argument("--size", type=float, default=2, help="synthetic page size in MB")
+    parser.add_argument("--number", type=int, default=20, help="iterations per page")
+    args = parser.parse_args()
+    run(saved_pages(args.pages) if args.pages else synthetic_pages(args.size), args.number)
@@ -0,0 +1,45 @@
+import argparse
+import logging
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from fixture_server import serve, MAP_BOUNDS, MAX_PAGES, PAGE_SIZE  # noqa: E402
+from zillow.map_search import Bounds, MapSearch  # noqa: E402
+from zillow.session import Session  # noqa: E402
+
+"""
+Crawls synthetic listings on the fixture server's map with the quadtree search
+reports coverage against the listings served and how many regions and pages it took
+>>> python benchmarks/bench_map_search.py --listings 20000 --concurrency 16
+"""
+
+
+def run(listings: int, concurrency: int, latency: float, max_results: int):
+    server = serve(map_listings=listings, latency=latency)
+    search = MapSearch(bounds=Bounds(**MAP_BOUNDS), session=Session(rate=None, max_concurrency=max(concurrency, 1)),
+                       max_results=max_results)
+    search.BASE_URL = f"http://127.0.0.1:{server.server_port}"
+    search.set_output_settings(cache_raw_zipcodes=False)
+    start = time.perf_counter()
+    results = search.get_all_listings(concurrency=concurrency or None, per_host=concurrency or 1)
+    elapsed = time.perf_counter() - start
+    # a single search of the whole map would stop at the pagination cap
+    print(f"listings {len(results)} of {listings * 2} in {elapsed:.2f}s, "
+          f"unsplit search would return {min(listings, MAX_PAGES * PAGE_SIZE) * 2}")
+    print(f"map search {search.stats}, minimum pages {-(-listings // PAGE_SIZE) * 2}")
+    print(f"server {server.RequestHandlerClass.config.stats}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.ERROR)
+    parser = argparse.ArgumentParser(description="map bounds quadtree search benchmark")
+    parser.add_argument("--listings", type=int, default=10000, help="listings per status on the map")
+    parser.add_argument("--concurrency", type=int, default=8, help="0 crawls serially")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--max-results", type=int, default=MAX_PAGES * PAGE_SIZE)
+    args = parser.parse_args()
+    run(args.listings, args.concurrency, args.latency, args.max_results)
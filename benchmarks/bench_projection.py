@@ -0,0 +1,78 @@
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import pandas as pd  # noqa: E402
+
+from zillow.formatter import Formatter, DETAILS, ADDRESS, HOME, DETAILS_APT, ADDRESS_APT, HOME_APT  # noqa: E402
+from zillow.projection import project  # noqa: E402
+
+"""
+Benchmark of column projection vs pd.json_normalize + select_rename_columns
+>>> python benchmarks/bench_projection.py --listings 50000
+"""
+
+"""synthetic listings"""
+
+
+def search_listing(i: int):
+    home_info = {f"field{n}": n for n in range(60)}
+    home_info.update({"zpid": i, "homeType": random.choice(["SINGLE_FAMILY", "CONDO", "TOWNHOUSE"]),
+                      "lotAreaValue": random.random() * 10, "lotAreaUnit": "acres", "price": i * 10})
+    listing = {
+        "zpid": str(i), "statusType": random.choice(["FOR_SALE", "FOR_RENT"]),
+        "detailUrl": f"https://www.zillow.com/homedetails/{i}_zpid/", "unformattedPrice": random.randint(1, 10 ** 6),
+        "addressStreet": f"{i} Main St", "addressState": "OH", "addressCity": "Columbus", "addressZipcode": "43085",
+        "beds": random.randint(1, 5), "baths": random.randint(1, 3), "area": random.randint(500, 4000),
+        "latLong": {"latitude": 40.0, "longitude": -83.0},
+        "variableData": {"type": "OPEN_HOUSE", "text": "Open house"},
+        "carouselPhotos": [{"url": f"https://photos.zillowstatic.com/{i}-{n}.jpg"} for n in range(20)],
+        "hdpData": {"homeInfo": home_info},
+    }
+    if i % 10 == 0:
+        del listing["area"]
+    return listing
+
+
+def unit_listing(i: int):
+    return {"homeStatus": "FOR_RENT", "hdpUrl": f"/homedetails/{i}_zpid/", "homeType": "APARTMENT",
+            "price": random.randint(500, 3000), "streetAddress": f"{i} High St", "state": "OH", "city": "Columbus",
+            "zipcode": "43085", "bedrooms": 1, "bathrooms": 1, "livingArea": 700,
+            "resoFacts": {f"fact{n}": n for n in range(100)}, "photos": [{"url": "x"}] * 30}
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def normalize_select(records, *mappings):
+    fmt = Formatter(records)
+    _ = fmt.df  # force json_normalize
+    return fmt.select_rename_columns(*mappings)
+
+
+def run(count: int):
+    random.seed(0)
+    cases = {
+        "search (DETAILS, ADDRESS, HOME)": ([search_listing(i) for i in range(count)], (DETAILS, ADDRESS, HOME)),
+        "units (DETAILS_APT, ADDRESS_APT, HOME_APT)": ([unit_listing(i) for i in range(count)],
+                                                      (DETAILS_APT, ADDRESS_APT, HOME_APT)),
+    }
+    print(f"{'case':<45} {'rows':>8} {'normalize s':>12} {'project s':>10} {'speedup':>8}")
+    for name, (records, mappings) in cases.items():
+        expected, normalize_s = timed(lambda: normalize_select(records, *mappings))
+        actual, project_s = timed(lambda: project(records, *mappings))
+        pd.testing.assert_frame_equal(expected.reset_index(drop=True), actual)
+        print(f"{name:<45} {count:>8} {normalize_s:>12.3f} {project_s:>10.3f} {normalize_s / project_s:>7.1f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="column projection benchmark")
+    parser.add_argument("--listings", type=int, default=20000, help="synthetic listings per case")
+    run(parser.parse_args().listings)
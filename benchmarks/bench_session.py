@@ -0,0 +1,47 @@
+import argparse
+import logging
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from fixture_server import serve  # noqa: E402
+from zillow.listings import Search  # noqa: E402
+from zillow.session import Session  # noqa: E402
+
+"""
+Crawls the local fixture server while it answers a fraction of requests with 429
+reports throughput, retries, blocks and where the adaptive concurrency window settled
+>>> python benchmarks/bench_session.py --throttle 0.2 --concurrency 16
+"""
+
+
+def run(zipcodes: int, listings: int, throttle: float, latency: float, concurrency: int, rate: float):
+    server = serve(listings=listings, throttle=throttle, latency=latency)
+    session = Session(rate=rate, max_concurrency=concurrency)
+    search = Search(zipcodes=list(range(43001, 43001 + zipcodes)), session=session)
+    search.BASE_URL = f"http://127.0.0.1:{server.server_port}"
+    search.set_output_settings(cache_raw_zipcodes=False)
+    start = time.perf_counter()
+    results = search.get_all_listings(concurrency=concurrency, per_host=concurrency)
+    elapsed = time.perf_counter() - start
+    expected = zipcodes * listings * 2
+    print(f"listings {len(results)} of {expected} in {elapsed:.2f}s "
+          f"({session.stats['requests'] / elapsed:.1f} requests/s)")
+    print(f"session {session.stats}, concurrency window {session.limiter.limit}")
+    print(f"server {server.RequestHandlerClass.config.stats}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.ERROR)
+    parser = argparse.ArgumentParser(description="session throttling benchmark")
+    parser.add_argument("--zipcodes", type=int, default=10)
+    parser.add_argument("--listings", type=int, default=400, help="listings per zipcode and status")
+    parser.add_argument("--throttle", type=float, default=0.1, help="fraction of requests answered with 429")
+    parser.add_argument("--latency", type=float, default=0.05, help="seconds added to every response")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--rate", type=float, default=None, help="requests per second, default unlimited")
+    args = parser.parse_args()
+    run(args.zipcodes, args.listings, args.throttle, args.latency, args.concurrency, args.rate)
@@ -0,0 +1,183 @@
+import argparse
+import json
+import logging
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from unittest import mock
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import requests  # noqa: E402
+
+from fixture_server import serve  # noqa: E402
+from zillow import extract  # noqa: E402
+from zillow.file_util import export_csv, export_parquet  # noqa: E402
+from zillow.formatter import ListingFormatter, DETAILS, ADDRESS, HOME, DETAILS_APT, ADDRESS_APT, HOME_APT  # noqa: E402
+from zillow.listings import Search  # noqa: E402
+from zillow.property import Apartments  # noqa: E402
+from zillow.session import Session  # noqa: E402
+
+"""
+Offline benchmark suite, every stage runs against the local fixture server and results are written as JSON
+>>> python benchmarks/bench_suite.py --zipcodes 10 --listings 400 --buildings 5 --latency 0.02
+>>> python benchmarks/bench_suite.py --compare ./data/benchmarks/20230101-120000.json
+scenarios: crawl (search pages), apartments (building + homedetails pages), extract, format, export
+"""
+
+RESULTS_DIR: str = "./data/benchmarks"
+
+
+def timed(func, repeat: int = 1):
+    """
+    :return: (fastest of repeat runs in seconds, result of the last run)
+    """
+    best, result = None, None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def scenario(seconds: float, items: int, unit: str, **extra):
+    return {"seconds": seconds, "items": items, "unit": unit,
+            "per_second": items / seconds if seconds else None, **extra}
+
+
+"""scenarios"""
+
+
+def bench_crawl(base_url: str, zipcodes: int, concurrency: int):
+    session = Session(rate=None, max_concurrency=max(concurrency, 1))
+    search = Search(zipcodes=list(range(43001, 43001 + zipcodes)), session=session)
+    search.BASE_URL = base_url
+    search.set_output_settings(cache_raw_zipcodes=False)
+    seconds, listings = timed(lambda: search.get_all_listings(concurrency=concurrency or None,
+                                                              per_host=concurrency or 1))
+    return scenario(seconds, len(listings), "listings", requests=session.stats["requests"]), listings
+
+
+def bench_apartments(base_url: str, listings: list, workers: int):
+    urls = [listing.get("detailUrl") for listing in listings if not listing.get("detailUrl").startswith("http")]
+    session = Session(rate=None, max_concurrency=max(workers, 1))
+    # patched for this scenario only, later code in the process still fetches from zillow
+    with mock.patch.object(Apartments, "BASE_URL", base_url):
+        seconds, units = timed(lambda: Apartments(urls, workers, session).data())
+    return scenario(seconds, len(units), "units", buildings=len(urls), requests=session.stats["requests"]), units
+
+
+def bench_extract(base_url: str, repeat: int):
+    pages = {
+        "search": (requests.get(f"{base_url}/homes/for_rent/43001_rb/").content, extract.search_results),
+        "building": (requests.get(f"{base_url}/b/fixture-apartments-43001-0/").content, extract.building),
+        "property": (requests.get(f"{base_url}/homedetails/9430010000000_zpid/").content, extract.property_details),
+    }
+    results = {}
+    for name, (page, parse) in pages.items():
+        assert parse(page) is not None, f"fixture {name} page did not parse"
+        seconds, _ = timed(lambda: [parse(page) for _ in range(100)], repeat)
+        results[name] = scenario(seconds / 100, 1, "pages", bytes=len(page))
+    return results
+
+
+def bench_format(listings: list, units: list, repeat: int):
+    def run():
+        data = ListingFormatter(listings, keep_raw=False)
+        data.select(DETAILS, ADDRESS, HOME)
+        data.remove_apartments()
+        apt_fmt = ListingFormatter(units, keep_raw=False)
+        apt_fmt.select(DETAILS_APT, ADDRESS_APT, HOME_APT)
+        apt_fmt.fix_urls()
+        data.concat_df(apt_fmt.df)
+        data.price_per_sqft()
+        data.remove_dupes()
+        return data.df
+
+    seconds, df = timed(run, repeat)
+    return scenario(seconds, len(listings) + len(units), "listings"), df
+
+
+def bench_export(df, repeat: int):
+    with tempfile.TemporaryDirectory() as directory:
+        csv_seconds, _ = timed(lambda: export_csv(df, f"{directory}/listings.csv"), repeat)
+        results = {"csv": scenario(csv_seconds, len(df), "rows")}
+        try:
+            parquet_seconds, _ = timed(lambda: export_parquet(df.assign(city="Columbus"), f"{directory}/parquet",
+                                                              "20230101"), repeat)
+            results["parquet"] = scenario(parquet_seconds, len(df), "rows")
+        except ImportError:
+            results["parquet"] = {"skipped": "pyarrow not installed"}
+    return results
+
+
+"""suite"""
+
+
+def run(zipcodes: int, listings: int, buildings: int, units: int, latency: float, page_kb: int, concurrency: int,
+        repeat: int):
+    config = {"zipcodes": zipcodes, "listings": listings, "buildings": buildings, "units": units,
+              "latency": latency, "page_kb": page_kb, "concurrency": concurrency, "repeat": repeat}
+    server = serve(listings=listings, latency=latency, buildings=buildings, units=units, page_kb=page_kb)
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    try:
+        crawl, raw_listings = bench_crawl(base_url, zipcodes, concurrency)
+        apartments, raw_units = bench_apartments(base_url, raw_listings, concurrency or 1)
+        extraction = bench_extract(base_url, repeat)
+        formatting, df = bench_format(raw_listings, raw_units, repeat)
+        export = bench_export(df, repeat)
+    finally:
+        server.shutdown()
+    return {"timestamp": datetime.now().isoformat(timespec="seconds"), "version": git_version(),
+            "python": platform.python_version(), "json_backend": extract.JSON_BACKEND, "config": config,
+            "scenarios": {"crawl": crawl, "apartments": apartments,
+                          **{f"extract.{name}": result for name, result in extraction.items()},
+                          "format": formatting, **{f"export.{name}": result for name, result in export.items()}}}
+
+
+def git_version():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=Path(__file__).resolve().parents[1]).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(results: dict, baseline: dict):
+    """prints each scenario's time against the baseline, positive change is slower"""
+    for name, result in results["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name, {}).get("seconds")
+        if "seconds" not in result or not before:
+            continue
+        change = (result["seconds"] - before) / before * 100
+        print(f"{name:<20} {before:>10.4f}s -> {result['seconds']:>10.4f}s  {change:+.1f}%")
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.ERROR)
+    parser = argparse.ArgumentParser(description="offline benchmark suite against the fixture server")
+    parser.add_argument("--zipcodes", type=int, default=5)
+    parser.add_argument("--listings", type=int, default=400, help="listings per zipcode and status")
+    parser.add_argument("--buildings", type=int, default=5, help="apartment buildings per zipcode")
+    parser.add_argument("--units", type=int, default=12, help="units per apartment building")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--page-kb", type=int, default=200, help="markup added to every page")
+    parser.add_argument("--concurrency", type=int, default=8, help="0 crawls serially")
+    parser.add_argument("--repeat", type=int, default=3, help="cpu bound scenarios keep the fastest run")
+    parser.add_argument("--output", default=None, help=f"results JSON, defaults to {RESULTS_DIR}/<timestamp>.json")
+    parser.add_argument("--compare", default=None, help="earlier results JSON to compare against")
+    args = parser.parse_args()
+    results = run(args.zipcodes, args.listings, args.buildings, args.units, args.latency, args.page_kb,
+                  args.concurrency, args.repeat)
+    output = Path(args.output or f"{RESULTS_DIR}/{datetime.now().strftime('%Y%m%d-%H%M%S')}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2))
+    print(json.dumps(results["scenarios"], indent=2))
+    print(f"Results: {output}")
+    if args.compare:
+        compare(results, json.loads(Path(args.compare).read_text()))
@@ -0,0 +1,250 @@
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+"""
+Local stand-in for zillow.com serving synthetic pages in the format zillow.extract expects
+>>> server = serve(port=0, listings=200, throttle=0.2)
+>>> search.BASE_URL = f"http://127.0.0.1:{server.server_port}"  # on the instance, Search itself is left unchanged
+>>> python benchmarks/fixture_server.py --port 8000 --throttle 0.1
+map bound searches (/homes/for_rent/?searchQueryState=...) return the synthetic listings inside mapBounds
+>>> server = serve(port=0, map_listings=5000)
+apartment buildings in for_rent results link to building pages (/b/...) whose units link to homedetails pages
+>>> server = serve(port=0, buildings=5, units=12, page_kb=300)
+"""
+
+PAGE_SIZE: int = 40
+# zillow returns at most this many pages for one search
+MAX_PAGES: int = 20
+# area map listings are scattered over, a third are clustered around DENSE_CENTER
+MAP_BOUNDS = {"north": 40.16, "south": 39.81, "east": -82.77, "west": -83.21}
+DENSE_CENTER = (39.96, -83.0)
+# units per floor plan on building pages
+PLAN_SIZE: int = 4
+
+
+class FixtureConfig:
+    def __init__(self, listings: int = 200, latency: float = 0.0, throttle: float = 0.0, seed: int = 0,
+                 map_listings: int = 0, buildings: int = 0, units: int = 10, page_kb: int = 0):
+        """
+        :param listings: listings per zipcode and status
+        :param map_listings: listings per status placed on the map for bound searches
+        :param buildings: for_rent listings per zipcode that are apartment buildings
+        :param units: units per apartment building
+        :param page_kb: markup added around the embedded JSON of every page, real pages are several hundred KB
+        :param latency: seconds added to every response
+        :param throttle: fraction of requests answered with 429
+        :param seed: random seed for throttling
+        """
+        self.listings = listings
+        self.latency = latency
+        self.throttle = throttle
+        self.random = random.Random(seed)
+        self.map_listings = map_listings
+        self.seed = seed
+        self.buildings = buildings
+        self.units = units
+        self.padding = filler(page_kb)
+        self.lock = threading.Lock()
+        self.stats = {"requests": 0, "throttled": 0}
+
+
+"""synthetic pages"""
+
+
+def filler(kb: int) -> str:
+    block = "<div class='filler'>" + "lorem ipsum " * 80 + "</div>\n"
+    return block * (kb * 1024 // len(block))
+
+
+def html(body: str, padding: str = "") -> str:
+    return f"<html><head>{padding}</head><body>{body}{padding}</body></html>"
+
+
+def search_listing(zipcode: str, status: str, i: int, lat: float = 40.0, lng: float = -83.0):
+    zpid = f"{zipcode}{0 if status == 'for_rent' else 1}{i:05d}"
+    price = 1000 + i * 10 if status == "for_rent" else 100000 + i * 1000
+    return {
+        "zpid": zpid, "statusType": status.upper(), "detailUrl": f"https://www.zillow.com/homedetails/{zpid}_zpid/",
+        "unformattedPrice": price, "addressStreet": f"{i} Main St", "addressCity": "Columbus", "addressState": "OH",
+        "addressZipcode": zipcode, "beds": 1 + i % 4, "baths": 1 + i % 2, "area": 600 + i % 50 * 40,
+        "latLong": {"latitude": lat, "longitude": lng},
+        "hdpData": {"homeInfo": {"zpid": int(zpid), "homeType": "SINGLE_FAMILY", "price": price,
+                                 "lotAreaValue": 0.25, "lotAreaUnit": "acres"}},
+    }
+
+
+def building_listing(zipcode: str, i: int, units: int):
+    """search result entry of an apartment building, its detailUrl is a partial /b/ url"""
+    return {
+        "statusType": "FOR_RENT", "detailUrl": f"/b/fixture-apartments-{zipcode}-{i}/", "buildingName": f"Fixture {i}",
+        "addressStreet": f"{i} Apartment Way", "addressCity": "Columbus", "addressState": "OH",
+        "addressZipcode": zipcode, "minBaseRent": 900 + i * 10, "availabilityCount": units,
+        "latLong": {"latitude": 40.0, "longitude": -83.0},
+        "units": [{"price": f"${900 + i * 10}+", "beds": str(beds)} for beds in range(1, 4)],
+    }
+
+
+def search_page(path: str, zipcode: str, status: str, page: int, total: int, config: FixtureConfig = None):
+    total_pages = max(1, -(-total // PAGE_SIZE))
+    first = (page - 1) * PAGE_SIZE
+    buildings = config.buildings if config and status == "for_rent" else 0
+    results = [building_listing(zipcode, i, config.units) if i < buildings else search_listing(zipcode, status, i)
+               for i in range(first, min(first + PAGE_SIZE, total))]
+    search_list = {"totalPages": total_pages, "totalResultCount": total}
+    if page < total_pages:
+        search_list["pagination"] = {"nextUrl": f"{path}{page + 1}_p/"}
+    data = {"queryState": {"pagination": {"currentPage": page}},
+            "cat1": {"searchList": search_list, "searchResults": {"listResults": results}}}
+    return html(f"<!--{json.dumps(data)}-->", config.padding if config else "")
+
+
+def building_zpid(zipcode: str, i: int) -> str:
+    return f"9{zipcode}{i:04d}"
+
+
+def building_page(zipcode: str, i: int, config: FixtureConfig):
+    """building object with floor plans of PLAN_SIZE units, unit zpids are building zpid + unit number"""
+    zpid = building_zpid(zipcode, i)
+    units = [{"zpid": f"{zpid}{u:03d}", "unitNumber": f"{u + 1}", "price": 900 + i * 10 + u * 25, "beds": 1 + u % 3,
+              "availableFrom": "1672531200000"} for u in range(config.units)]
+    plans = [{"zpid": f"{zpid}p{n}", "beds": 1 + n % 3, "units": units[start:start + PLAN_SIZE]}
+             for n, start in enumerate(range(0, len(units), PLAN_SIZE))]
+    data = {"props": {"initialData": {"building": {
+        "zpid": zpid, "buildingName": f"Fixture {i}",
+        "address": {"streetAddress": f"{i} Apartment Way", "city": "Columbus", "state": "OH", "zipcode": zipcode},
+        "bestMatchedUnit": {"hdpUrl": f"/homedetails/{i}-Apartment-Way-Columbus-OH-{zipcode}/{zpid}_zpid/"},
+        "floorPlans": plans}}}}
+    return html(f'<script id="__NEXT_DATA__" type="application/json">{json.dumps(data)}</script>', config.padding)
+
+
+def property_page(zpid: str, config: FixtureConfig):
+    """homedetails page, apiCache is a JSON string and the property is under its second key"""
+    unit = int(zpid[-3:]) if len(zpid) > 10 else 0
+    zipcode = zpid[1:6] if len(zpid) > 10 else "43000"
+    prop = {"zpid": int(zpid) if zpid.isdigit() else zpid, "homeStatus": "FOR_RENT",
+            "hdpUrl": f"/homedetails/unit-{zpid}/{zpid}_zpid/", "homeType": "APARTMENT", "price": 900 + unit * 25,
+            "streetAddress": f"Apartment Way #{unit + 1}", "state": "OH", "city": "Columbus", "zipcode": zipcode,
+            "bedrooms": 1 + unit % 3, "bathrooms": 1, "livingArea": 550 + unit % 3 * 250,
+            "description": "Synthetic unit " * 20, "photos": [{"url": f"https://photos.example/{zpid}-{n}.jpg"}
+                                                                for n in range(25)]}
+    api_cache = {f'VariantQuery{{"zpid":{zpid}}}': {"property": {"zpid": zpid}},
+                 f'FullRenderQuery{{"zpid":{zpid}}}': {"property": prop}}
+    data = {"apiCache": json.dumps(api_cache)}
+    return html(f'<script id="hdpApolloPreloadedData" type="application/json">{json.dumps(data)}</script>',
+                config.padding)
+
+
+@lru_cache(maxsize=None)
+def map_points(count: int, seed: int):
+    """[(lat, lng)] of the map listings, uneven density so some regions need splitting and others don't"""
+    rand = random.Random(seed)
+    points = []
+    for i in range(count):
+        if i % 3 == 0:
+            points.append((DENSE_CENTER[0] + rand.gauss(0, 0.01), DENSE_CENTER[1] + rand.gauss(0, 0.01)))
+        else:
+            points.append((rand.uniform(MAP_BOUNDS["south"], MAP_BOUNDS["north"]),
+                           rand.uniform(MAP_BOUNDS["west"], MAP_BOUNDS["east"])))
+    return points
+
+
+def map_page(path: str, status: str, query: dict, config: FixtureConfig):
+    bounds = query.get("mapBounds")
+    page = query.get("pagination", {}).get("currentPage", 1)
+    inside = [(i, lat, lng) for i, (lat, lng) in enumerate(map_points(config.map_listings, config.seed))
+              if bounds["south"] <= lat <= bounds["north"] and bounds["west"] <= lng <= bounds["east"]]
+    total_pages = min(MAX_PAGES, max(1, -(-len(inside) // PAGE_SIZE)))
+    first = (page - 1) * PAGE_SIZE
+    results = [search_listing("43000", status, i, lat, lng) for i, lat, lng in inside[first:first + PAGE_SIZE]]
+    search_list = {"totalPages": total_pages, "totalResultCount": len(inside)}
+    if page < total_pages:
+        search_list["pagination"] = {"nextUrl": path}
+    data = {"queryState": {"pagination": {"currentPage": page}, "mapBounds": bounds},
+            "cat1": {"searchList": search_list, "searchResults": {"listResults": results}}}
+    return html(f"<!--{json.dumps(data)}-->", config.padding)
+
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    config: FixtureConfig = None
+    search_url = re.compile(r'^(/homes/(for_rent|for_sale)/(\d+)_rb/)(?:(\d+)_p/)?$')
+    map_url = re.compile(r'^/homes/(for_rent|for_sale)/\?searchQueryState=(.+)$')
+    building_url = re.compile(r'^/b/fixture-apartments-(\d+)-(\d+)/$')
+    property_url = re.compile(r'^/homedetails/(?:[^/]+/)?(\w+)_zpid/$')
+
+    def do_GET(self):
+        config = self.config
+        with config.lock:
+            config.stats["requests"] += 1
+            throttled = config.random.random() < config.throttle
+            if throttled:
+                config.stats["throttled"] += 1
+        if config.latency:
+            time.sleep(config.latency)
+        if throttled:
+            return self._send(429, "Too Many Requests", {"Retry-After": "0"})
+        map_match = self.map_url.match(self.path)
+        if map_match:
+            status, query = map_match.groups()
+            return self._send(200, map_page(self.path, status, json.loads(unquote(query)), config))
+        building_match = self.building_url.match(self.path)
+        if building_match:
+            zipcode, i = building_match.groups()
+            return self._send(200, building_page(zipcode, int(i), config))
+        property_match = self.property_url.match(self.path)
+        if property_match:
+            return self._send(200, property_page(property_match.group(1), config))
+        match = self.search_url.match(self.path)
+        if not match:
+            return self._send(404, "Not Found")
+        path, status, zipcode, page = match.groups()
+        self._send(200, search_page(path, zipcode, status, int(page or 1), config.listings, config))
+
+    def _send(self, status: int, body: str, headers: dict = None):
+        content = body.encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(content)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
+def serve(port: int = 0, **config) -> ThreadingHTTPServer:
+    """
+    Starts the fixture server on a daemon thread, port 0 picks a free port (see server.server_port)
+    :param config: FixtureConfig arguments
+    """
+    handler = type("Handler", (FixtureHandler,), {"config": FixtureConfig(**config)})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="local zillow stand-in")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--listings", type=int, default=200, help="listings per zipcode and status")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--throttle", type=float, default=0.0, help="fraction of requests answered with 429")
+    parser.add_argument("--map-listings", type=int, default=0, help="listings per status for map bound searches")
+    parser.add_argument("--buildings", type=int, default=0, help="apartment buildings per zipcode")
+    parser.add_argument("--units", type=int, default=10, help="units per apartment building")
+    parser.add_argument("--page-kb", type=int, default=0, help="markup added to every page")
+    args = parser.parse_args()
+    fixture = serve(args.port, listings=args.listings, latency=args.latency, throttle=args.throttle,
+                    map_listings=args.map_listings, buildings=args.buildings, units=args.units,
+                    page_kb=args.page_kb)
+    print(f"Serving on http://127.0.0.1:{fixture.server_port}")
+    threading.Event().wait()
@@ -1,10 +1,20 @@
 import logging
 from datetime import datetime
 
-from zillow.file_util import export_csv, write_json
+from zillow.building_cache import BuildingCache
+from zillow.cache import ResponseCache
+from zillow.dedupe import DedupeIndex
+from zillow.delta import SNAPSHOT_FILE, SnapshotStore, diff_snapshot
+from zillow.file_util import export_csv, export_parquet, write_json
 from zillow.listings import Search
-from zillow.formatter import *
-from zillow.property import Apartments
+from zillow.map_search import MapSearch
+from zillow.metrics import METRICS
+from zillow.pipeline import stream_export
+from zillow.rollup import Rollup, RollupStore
+from zillow.run import format_data  # shared with zillow.batch
+from zillow.session import Session
+from zillow.store import ListingStore
+from zillow.work_queue import WorkQueue
 
 logging.basicConfig(level=logging.INFO)
 
@@ -13,35 +23,11 @@ LISTINGS_FILE = "./data/results/{}/{}-listings.csv"
 FOR_SALE_LISTINGS_FILE = "./data/results/{}/{}-for-sale.csv"
 FOR_RENT_LISTINGS_FILE = "./data/results/{}/{}-for-rent.csv"
 ZIPCODE_FILE = "./data/results/{}/{}-zipcodes.json"
-
-
-def format_data(listings, apartment_file=None, include_apartments=False):
-    """transform and format listing data"""
-
-    data = ListingFormatter(listings)
-    data.select(DETAILS, ADDRESS, HOME)
-
-    """apartments"""
-    apartment_urls = data.apartment_urls()
-    if apartment_file:
-        write_json(apartment_urls, apartment_file)
-
-    data.remove_apartments()
-
-    if include_apartments:
-        logging.info(f"Fetching more data for {len(apartment_urls)} apartments")
-        # formatting is fragmented, updates to `data` (listings df) must be applied to apartments df
-        apt_data = Apartments(apartment_urls).data()
-        apt_fmt = ListingFormatter(apt_data)
-        apt_fmt.select(DETAILS_APT, ADDRESS_APT, HOME_APT)
-        apt_fmt.fix_urls()
-        data.concat_df(apt_fmt.df)
-
-    """calc columns"""
-    data.price_per_sqft()
-    data.remove_dupes()
-
-    return data.df
+QUEUE_FILE = "./data/results/{}/{}-queue.db"
+DELTA_FILE = "./data/results/{}/{}-delta.csv"
+METRICS_REPORT_FILE = "./data/results/{}/{}-metrics.json"
+METRICS_PROMETHEUS_FILE = "./data/results/{}/{}-metrics.prom"
+PARQUET_DIR = "./data/results/parquet"
 
 
 def stats(df):
@@ -52,16 +38,83 @@ def stats(df):
     print(by_status)
 
 
-def export_listings(city="columbus", state="ohio"):
+def export_listings(city="columbus", state="ohio", concurrency=None, cache_responses=False, resume=False,
+                    export_format="csv", chunk_size=None, incremental=False, include_apartments=False,
+                    map_search=False, metrics=False, store_listings=False, rollups=False, workers=1):
+    if incremental and chunk_size:
+        raise ValueError("incremental runs diff the full listings, they cannot be streamed in chunks")
+    if chunk_size and concurrency:
+        raise ValueError("chunked runs stream search pages serially, they cannot be combined with concurrency")
+    if chunk_size and export_format != "csv":
+        raise ValueError("chunked runs append to csv files, they cannot export parquet")
+    if incremental and not include_apartments:
+        # unchanged details are only skipped through building_cache, which only apartments use
+        logging.warning("incremental without include_apartments only writes the delta csv, nothing is skipped")
     date = datetime.now().date().strftime("%Y%m%d")
-    search = Search(city=city, state=state)
+    if metrics:
+        # request latency, bytes, parse and stage timings, cache hits and rows per stage for this run
+        METRICS.enable()
+    session = Session(cache=ResponseCache()) if cache_responses else None
+    # a resumed run replays the day's finished pages, buildings and units
+    queue = WorkQueue(QUEUE_FILE.format(date, city)) if resume else None
+    # listings, buildings and units repeated across zipcodes are fetched and exported once
+    dedupe = DedupeIndex()
+    # unit lists of buildings and details of unchanged units are kept across runs
+    building_cache = BuildingCache() if include_apartments else None
+    # map search splits the city's bounding box into quadrants instead of walking its zipcodes
+    search_type = MapSearch if map_search else Search
+    search = search_type(city=city, state=state, session=session, queue=queue, dedupe=dedupe)
+    # every run is also kept in one indexed SQLite file for queries across dates
+    store = ListingStore() if store_listings else None
+    # per zipcode/status aggregates and price sketches appended to a time series across runs
+    rollup = Rollup() if rollups else None
     write_json(search.zipcodes, ZIPCODE_FILE.format(date, city))
-    listings = search.get_all_listings(read_cache=True)
-    df = format_data(listings, APARTMENT_URL_FILE.format(date, city))
-    export_csv(df, LISTINGS_FILE.format(date, city))
-    stats(df)
-    export_csv(df[df["status"] == "FOR_SALE"], FOR_SALE_LISTINGS_FILE.format(date, city))
-    export_csv(df[df["status"] == "FOR_RENT"], FOR_RENT_LISTINGS_FILE.format(date, city))
+    if chunk_size:
+        # bounded memory: pages are formatted and appended to the csv files chunk by chunk
+        running = stream_export(search, LISTINGS_FILE.format(date, city), FOR_SALE_LISTINGS_FILE.format(date, city),
+                                FOR_RENT_LISTINGS_FILE.format(date, city), APARTMENT_URL_FILE.format(date, city),
+                                chunk_size, read_cache=True, include_apartments=include_apartments,
+                                workers=workers, session=session, queue=queue, dedupe=dedupe, building_cache=building_cache,
+                                store=store, date=date, market=city, rollup=rollup)
+        print(running.by_zipcode())
+        print(running.by_status())
+    else:
+        listings = search.get_all_listings(read_cache=True, concurrency=concurrency)
+        # an incremental run also writes what changed since the last run
+        # with include_apartments, unchanged buildings and units also come from building_cache instead of zillow
+        snapshot = SnapshotStore(SNAPSHOT_FILE.format(city)) if incremental else None
+        # apartment buildings and units are fetched by workers threads
+        df = format_data(listings, APARTMENT_URL_FILE.format(date, city), include_apartments, workers=workers,
+                         session=session, queue=queue, dedupe=dedupe, building_cache=building_cache)
+        if rollup is not None:
+            rollup.update(df)
+        if store:
+            store.write(df, date, city)
+            print(store.stats_by_zipcode(date, city))
+            print(store.stats_by_status(date, city))
+        else:
+            stats(df)
+        if snapshot:
+            export_csv(diff_snapshot(snapshot.listings(), df), DELTA_FILE.format(date, city))
+            snapshot.save_listings(df, date)
+        if export_format == "parquet":
+            # one dataset partitioned by date/city/status replaces the three csv files
+            export_parquet(df, PARQUET_DIR, date)
+        else:
+            export_csv(df, LISTINGS_FILE.format(date, city))
+            export_csv(df[df["status"] == "FOR_SALE"], FOR_SALE_LISTINGS_FILE.format(date, city))
+            export_csv(df[df["status"] == "FOR_RENT"], FOR_RENT_LISTINGS_FILE.format(date, city))
+    if rollup is not None:
+        RollupStore().save(date, city, rollup)
+    if session:
+        logging.info(f"Response cache: {session.cache.stats()}")
+    if queue:
+        logging.info(f"Work queue: {queue.stats()}")
+    logging.info(f"Duplicates skipped: {dedupe.stats()}")
+    if metrics:
+        METRICS.write_report(METRICS_REPORT_FILE.format(date, city))
+        METRICS.write_prometheus(METRICS_PROMETHEUS_FILE.format(date, city))
+        METRICS.disable()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,62 @@
+import os
+import types
+import zlib
+
+import pytest
+
+import zillow.cache
+from zillow.cache import ResponseCache
+
+SEARCH_URL = "https://www.zillow.com/homes/for_rent/43085_rb/"
+UNIT_URL = "https://www.zillow.com/homedetails/1-Main-St/12345_zpid/"
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(zillow.cache, "time", types.SimpleNamespace(time=lambda: now[0]))
+    return now
+
+
+def test_expires_by_url_pattern(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "responses.db"), ttls={r"/homes/": 10, r"/homedetails/": 100})
+    cache.put(SEARCH_URL, b"search")
+    cache.put(UNIT_URL, b"unit")
+    clock[0] += 50
+    assert cache.get(SEARCH_URL) is None
+    assert cache.get(UNIT_URL) == b"unit"
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_urls_matching_no_pattern_never_expire(tmp_path, clock):
+    cache = ResponseCache(str(tmp_path / "responses.db"), ttls={r"/homes/": 10})
+    cache.put(UNIT_URL, b"unit")
+    clock[0] += 10 ** 9
+    assert cache.get(UNIT_URL) == b"unit"
+
+
+def test_evicts_least_recently_used(tmp_path, clock):
+    body = os.urandom(1024)
+    cache = ResponseCache(str(tmp_path / "responses.db"), ttls={}, max_size=2 * len(zlib.compress(body)))
+    cache.put("a", body)
+    clock[0] += 1
+    cache.put("b", body)
+    clock[0] += 1
+    assert cache.get("a") == body  # "b" is now the least recently used
+    clock[0] += 1
+    cache.put("c", body)
+    assert cache.get("b") is None
+    assert cache.get("a") == body and cache.get("c") == body
+    assert cache.stats()["entries"] == 2
+
+
+def test_size_survives_reopen_and_delete(tmp_path):
+    db_file = str(tmp_path / "responses.db")
+    cache = ResponseCache(db_file)
+    cache.put(SEARCH_URL, b"x" * 1000)
+    cache.put(UNIT_URL, b"y" * 1000)
+    size = cache.stats()["size"]
+    assert ResponseCache(db_file).stats()["size"] == size
+    cache.delete(SEARCH_URL)
+    assert cache.get(SEARCH_URL) is None
+    assert ResponseCache(db_file).stats()["size"] == cache.stats()["size"] < size
@@ -0,0 +1,50 @@
+import pandas as pd
+
+from zillow.delta import SnapshotStore, diff_snapshot, zpid_from_url, ADDED, REMOVED, CHANGED
+
+
+def listings(*rows):
+    return pd.DataFrame([{"url": f"https://www.zillow.com/homedetails/{zpid}_zpid/", "status": status,
+                          "listed": listed} for zpid, status, listed in rows])
+
+
+def changes(delta):
+    return {row.zpid: row.change for row in delta.itertuples()}
+
+
+def test_zpid_from_url():
+    assert zpid_from_url("https://www.zillow.com/homedetails/1-Main-St/12345_zpid/") == "12345"
+    assert zpid_from_url("/b/some-building/") is None
+    assert zpid_from_url(None) is None
+
+
+def test_diff_against_saved_snapshot(tmp_path):
+    store = SnapshotStore(str(tmp_path / "snapshot.db"))
+    store.save_listings(listings(("1", "FOR_SALE", 100), ("2", "FOR_SALE", 200), ("3", "FOR_RENT", 1500),
+                                 ("4", "FOR_RENT", None)), "20230101")
+    current = listings(("1", "FOR_SALE", 100), ("2", "FOR_SALE", 180), ("3", "FOR_SALE", 1500),
+                       ("4", "FOR_RENT", None), ("5", "FOR_RENT", 900))
+    delta = diff_snapshot(store.listings(), current)
+    assert changes(delta) == {"2": CHANGED, "3": CHANGED, "5": ADDED}
+    assert delta.set_index("zpid").loc["2", "price_change"] == -20
+
+    current = current[current["url"].map(zpid_from_url) != "1"]
+    assert changes(diff_snapshot(store.listings(), current))["1"] == REMOVED
+
+
+def test_removed_listing_keeps_previous_url(tmp_path):
+    store = SnapshotStore(str(tmp_path / "snapshot.db"))
+    store.save_listings(listings(("1", "FOR_SALE", 100)), "20230101")
+    delta = diff_snapshot(store.listings(), listings(("2", "FOR_SALE", 100)))
+    removed = delta.set_index("zpid").loc["1"]
+    assert removed["change"] == REMOVED
+    assert removed["url"].endswith("/1_zpid/")
+    assert removed["previous_status"] == "FOR_SALE"
+
+
+def test_save_replaces_previous_run(tmp_path):
+    store = SnapshotStore(str(tmp_path / "snapshot.db"))
+    store.save_listings(listings(("1", "FOR_SALE", 100)), "20230101")
+    store.save_listings(listings(("2", "FOR_SALE", 100), ("2", "FOR_SALE", 100)), "20230102")
+    assert store.listings()["zpid"].tolist() == ["2"]
+    assert diff_snapshot(store.listings(), listings(("2", "FOR_SALE", 100))).empty
@@ -0,0 +1,43 @@
+import operator
+
+from zillow.formatter import ListingFormatter
+
+LISTINGS = [
+    {"url": "a", "status": "FOR_SALE"},
+    {"url": "a", "status": "FOR_RENT"},
+    {"url": "b", "status": None},
+    {"url": "b", "status": "FOR_RENT"},
+    {"url": "c", "status": "FOR_RENT"},
+    {"url": "c", "status": "FOR_RENT"},
+]
+
+
+def formatter(listings=LISTINGS):
+    return ListingFormatter(listings)
+
+
+def test_remove_dupes_keeps_first_row_with_status():
+    data = formatter()
+    data.remove_dupes()
+    assert data.df[["url", "status"]].values.tolist() == [["a", "FOR_SALE"], ["b", "FOR_RENT"], ["c", "FOR_RENT"]]
+
+
+def test_filter_then_remove_dupes_matches_eager_evaluation():
+    lazy = formatter()
+    lazy.fmt.filter("status", operator.eq, "FOR_RENT")
+    lazy.remove_dupes()
+
+    eager = formatter()
+    eager.fmt.filter("status", operator.eq, "FOR_RENT")
+    eager.df  # runs the filter before the dedupe step is planned
+    eager.remove_dupes()
+
+    expected = [["a", "FOR_RENT"], ["b", "FOR_RENT"], ["c", "FOR_RENT"]]
+    assert lazy.df[["url", "status"]].values.tolist() == expected
+    assert eager.df[["url", "status"]].values.tolist() == expected
+
+
+def test_remove_dupes_without_key_keeps_repeats():
+    data = formatter()
+    data.remove_dupes(key_col=None)
+    assert len(data.df) == 5
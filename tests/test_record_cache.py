@@ -0,0 +1,74 @@
+import json
+import os
+
+import pytest
+
+from zillow.record import to_records
+from zillow.record_cache import (RecordWriter, TRAILER, write_records, read_index, read_records, lookup_record,
+                                 iter_record_batches, is_compact, record_file)
+
+LISTINGS = [{"zpid": i, "statusType": "FOR_RENT" if i % 2 else "FOR_SALE", "detailUrl": f"/homedetails/{i}_zpid/"}
+            for i in range(10)]
+
+
+@pytest.fixture
+def file(tmp_path):
+    return str(tmp_path / "43085.rec")
+
+
+def test_reads_back_by_status_and_key(file):
+    write_records(LISTINGS, file)
+    assert read_records(file) == LISTINGS
+    assert read_records(file, status="FOR_RENT") == [listing for listing in LISTINGS if listing["zpid"] % 2]
+    assert lookup_record(file, 4) == LISTINGS[4]
+    assert lookup_record(file, 42) is None
+    assert [len(batch) for batch in iter_record_batches(file, 4)] == [4, 4, 2]
+
+
+def test_index_is_stored_in_the_record_file(file):
+    write_records(LISTINGS, file, fetched=123.0)
+    assert os.listdir(os.path.dirname(file)) == ["43085.rec"]
+    index = read_index(file)
+    assert index["fetched"] == 123.0 and index["count"] == len(LISTINGS)
+
+
+def test_truncated_or_foreign_file_is_a_cache_miss(file):
+    write_records(LISTINGS, file)
+    with open(file, 'rb') as f:
+        data = f.read()
+    with open(file, 'wb') as f:
+        f.write(data[:-1])
+    assert read_index(file) is None and read_records(file) == []
+    with open(file, 'wb') as f:
+        f.write(b"x" * (TRAILER.size + 10))
+    assert read_index(file) is None
+    with open(file, 'wb') as f:
+        f.write(b"x")
+    assert read_index(file) is None
+
+
+def test_aborted_writer_keeps_previous_file(file):
+    write_records(LISTINGS[:2], file)
+    writer = RecordWriter(file)
+    writer.extend(LISTINGS)
+    writer.abort()
+    assert read_records(file) == LISTINGS[:2]
+    assert not os.path.exists(f"{file}.tmp")
+
+
+def test_compact_flag(file):
+    write_records(to_records(LISTINGS), file)
+    assert is_compact(file)
+    write_records(to_records(LISTINGS, keep_raw=True), file)
+    assert not is_compact(file)
+    write_records(LISTINGS, file)
+    assert not is_compact(file)
+
+
+def test_legacy_json_is_migrated(file):
+    legacy = file.replace(".rec", ".json")
+    with open(legacy, 'w') as f:
+        json.dump(LISTINGS, f)
+    assert read_records(file) == LISTINGS
+    assert not os.path.exists(legacy)
+    assert record_file(legacy) == file
@@ -0,0 +1,117 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import zillow.session
+from zillow.session import Session, RequestFailed
+from zillow.throttle import TokenBucket, AdaptiveLimiter, backoff_delay
+
+PAGE = b"<html>" + b"x" * 1024 + b"</html>"
+
+
+class StubServer:
+    """serves the scripted statuses in order, then 200 for every later request"""
+
+    def __init__(self):
+        self.statuses = []
+        self.requests = 0
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                stub.requests += 1
+                status = stub.statuses.pop(0) if stub.statuses else 200
+                self.send_response(status)
+                if status == 429:
+                    self.send_header("Retry-After", "0")
+                self.send_header("Content-Length", str(len(PAGE)))
+                self.end_headers()
+                self.wfile.write(PAGE)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}/homes/for_rent/43085_rb/"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    # retries of 5xx back off without sleeping, 429s carry Retry-After: 0
+    monkeypatch.setattr(zillow.session, "BACKOFF_BASE", 0)
+    server = StubServer()
+    yield server
+    server.close()
+
+
+def test_retries_429_then_returns_200(stub):
+    stub.statuses = [429, 429]
+    session = Session(retries=3)
+    response = session.get(stub.url)
+    assert response.status_code == 200
+    assert session.stats == {"requests": 3, "retries": 2, "blocks": 2, "errors": 0}
+
+
+def test_blocks_shrink_the_window_and_successes_grow_it_back(stub):
+    stub.statuses = [429, 429]
+    session = Session(initial_concurrency=4, max_concurrency=4, retries=3)
+    session.get(stub.url)
+    # 4 -> 2 -> 1 on the blocks, then +1/limit on the success
+    assert session.limiter.limit == 2
+    for _ in range(6):
+        session.get(stub.url)
+    assert session.limiter.limit == 4
+
+
+def test_raises_request_failed_after_bounded_retries(stub):
+    stub.statuses = [429] * 10
+    session = Session(retries=2)
+    with pytest.raises(RequestFailed) as failed:
+        session.get(stub.url)
+    assert failed.value.response.status_code == 429
+    assert stub.requests == 3
+    assert session.stats == {"requests": 3, "retries": 2, "blocks": 3, "errors": 0}
+    assert session.limiter.limit == 1
+
+
+def test_retries_5xx_without_shrinking_the_window(stub):
+    stub.statuses = [503]
+    session = Session(initial_concurrency=4, retries=1)
+    assert session.get(stub.url).status_code == 200
+    assert session.stats == {"requests": 2, "retries": 1, "blocks": 0, "errors": 0}
+    assert session.limiter.limit == 4
+
+
+def test_token_bucket_waits_once_the_burst_is_spent():
+    now, sleeps = [0.0], []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    bucket = TokenBucket(rate=2, burst=2, clock=lambda: now[0], sleep=sleep)
+    for _ in range(4):
+        bucket.acquire()
+    assert sleeps == [0.5, 0.5]
+
+
+def test_adaptive_limiter_stays_within_bounds():
+    limiter = AdaptiveLimiter(initial=2, minimum=1, maximum=3)
+    for _ in range(5):
+        limiter.on_block()
+    assert limiter.limit == 1
+    for _ in range(20):
+        limiter.on_success()
+    assert limiter.limit == 3
+
+
+def test_backoff_delay_is_capped():
+    assert backoff_delay(3, base=1.0, cap=60.0, rand=lambda: 1.0) == 8.0
+    assert backoff_delay(10, base=1.0, cap=60.0, rand=lambda: 1.0) == 60.0
+    assert backoff_delay(10, base=1.0, cap=60.0, rand=lambda: 0.0) == 0.0
@@ -0,0 +1,76 @@
+import pytest
+
+from zillow.work_queue import WorkQueue, run_queued, PAGE, DONE, FAILED, PENDING
+
+
+class Fetcher:
+    def __init__(self, fail=()):
+        self.fail = set(fail)
+        self.calls = []
+
+    def __call__(self, key):
+        self.calls.append(key)
+        if key in self.fail:
+            raise Exception("failed", key)
+        return {"key": key}
+
+
+def run(queue, fetcher, keys):
+    results = {}
+    for key in keys:
+        try:
+            results[key] = run_queued(queue, PAGE, key, fetcher, key)
+        except Exception:
+            results[key] = None
+    return results
+
+
+def test_resume_replays_finished_jobs_and_retries_failed(tmp_path):
+    db_file = str(tmp_path / "queue.db")
+    keys = ["a", "b", "c"]
+    first = Fetcher(fail={"b"})
+    assert run(WorkQueue(db_file), first, keys) == {"a": {"key": "a"}, "b": None, "c": {"key": "c"}}
+    assert WorkQueue(db_file).stats() == {PAGE: {DONE: 2, FAILED: 1}}
+
+    second = Fetcher()
+    assert run(WorkQueue(db_file), second, keys) == {key: {"key": key} for key in keys}
+    assert second.calls == ["b"]
+    assert WorkQueue(db_file).stats() == {PAGE: {DONE: 3}}
+
+
+def test_failed_job_is_skipped_after_max_attempts(tmp_path):
+    db_file = str(tmp_path / "queue.db")
+    for _ in range(2):
+        run(WorkQueue(db_file, max_attempts=2), Fetcher(fail={"a"}), ["a"])
+    fetcher = Fetcher()
+    assert run(WorkQueue(db_file, max_attempts=2), fetcher, ["a"]) == {"a": None}
+    assert fetcher.calls == []
+
+
+def test_retries_within_one_run_count_as_one_attempt(tmp_path):
+    queue = WorkQueue(str(tmp_path / "queue.db"), max_attempts=2)
+    fetcher = Fetcher(fail={"a"})
+    for _ in range(3):
+        run(queue, fetcher, ["a"])
+    assert len(fetcher.calls) == 3
+    assert queue.attempts(PAGE, "a") == 1
+
+
+def test_interrupted_jobs_are_pending_again(tmp_path):
+    db_file = str(tmp_path / "queue.db")
+    queue = WorkQueue(db_file)
+    queue.add(PAGE, ["a"])
+    queue.start(PAGE, "a")
+    assert WorkQueue(db_file).stats() == {PAGE: {PENDING: 1}}
+
+
+def test_none_result_marks_job_failed(tmp_path):
+    queue = WorkQueue(str(tmp_path / "queue.db"))
+    assert queue.run(PAGE, "a", lambda: None) is None
+    assert queue.stats() == {PAGE: {FAILED: 1}}
+
+
+def test_without_queue_runs_directly():
+    assert run_queued(None, PAGE, "a", lambda key: key * 2, "a") == "aa"
+    with pytest.raises(Exception):
+        run_queued(None, PAGE, "a", Fetcher(fail={"a"}), "a")
@@ -0,0 +1,134 @@
+import argparse
+import json
+import logging
+import os
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from datetime import datetime
+from typing import List, Tuple
+
+from .cache import ResponseCache
+from .file_util import export_csv, export_parquet, write_json
+from .listings import Search
+from .run import format_data
+from .session import Session
+from .zipcode_util import fetch_zipcodes
+
+log = logging.getLogger(__name__)
+
+"""
+Exports many cities in one process: fetching shares a Session (connection pool, rate limit, response cache)
+on a thread pool and formatting runs on a process pool, output files match main.export_listings
+>>> run_batch([("columbus", "ohio"), ("cleveland", "ohio")])
+>>> run_batch(load_cities("cities.json"), fetch_workers=4, format_workers=8)
+>>> python -m zillow.batch cities.json --concurrency 8
+"""
+
+APARTMENT_URL_FILE = "./data/results/{}/{}-apartments.json"
+LISTINGS_FILE = "./data/results/{}/{}-listings.csv"
+FOR_SALE_LISTINGS_FILE = "./data/results/{}/{}-for-sale.csv"
+FOR_RENT_LISTINGS_FILE = "./data/results/{}/{}-for-rent.csv"
+ZIPCODE_FILE = "./data/results/{}/{}-zipcodes.json"
+PARQUET_DIR = "./data/results/parquet"
+
+# cities crawled at once, they share the session's rate limit and concurrency window
+FETCH_WORKERS: int = 4
+
+
+def load_cities(config_file: str) -> List[Tuple[str, str]]:
+    """
+    :param config_file: JSON list of [city, state] pairs or {"city": ..., "state": ...} objects
+    """
+    with open(config_file, 'r') as f:
+        entries = json.load(f)
+    return [(entry["city"], entry["state"]) if isinstance(entry, dict) else tuple(entry) for entry in entries]
+
+
+def run_batch(cities: List[Tuple[str, str]], fetch_workers: int = FETCH_WORKERS, format_workers: int = None,
+              concurrency: int = None, cache_responses: bool = True, export_format: str = "csv"):
+    """
+    Fetches, formats and exports listings for each city/state
+    :param cities: [(city, state), ...], city names must be unique, output files are named by city like main.py
+    :param fetch_workers: cities crawled at the same time
+    :param format_workers: formatting processes, defaults to the number of cores
+    :param concurrency: requests in flight per city crawl, see Search.get_all_listings
+    :param cache_responses: share a ResponseCache between all cities
+    :param export_format: csv or parquet, like main.export_listings
+    :return: {(city, state): {status: listings}}, cities that failed to resolve, fetch or export are logged and left out
+    """
+    # output files and parquet partitions are keyed by city name, the same name in two states would overwrite
+    repeated = [city for city, count in Counter(city.lower() for city, _ in cities).items() if count > 1]
+    if repeated:
+        raise ValueError(f"City names must be unique within a batch, run these separately: {repeated}")
+    date = datetime.now().date().strftime("%Y%m%d")
+    session = Session(cache=ResponseCache() if cache_responses else None)
+    # zipcode index is read once here, not once per city process, a city that does not resolve is skipped
+    zipcodes = {}
+    for city, state in cities:
+        try:
+            zipcodes[(city, state)] = fetch_zipcodes(city, state)
+        except Exception as e:
+            log.error(f"Failed to find zipcodes for {city}, {state}: {e}")
+            continue
+        if not zipcodes[(city, state)]:
+            log.error(f"Failed to find zipcodes for {city}, {state}: no standard zipcodes")
+            del zipcodes[(city, state)]
+    summary = {}
+    with ThreadPoolExecutor(fetch_workers) as fetchers, ProcessPoolExecutor(format_workers) as formatters:
+        fetches = {fetchers.submit(_fetch_city, city, city_zipcodes, session, concurrency): (city, state)
+                   for (city, state), city_zipcodes in zipcodes.items()}
+        exports = {}
+        for future in as_completed(fetches):
+            city, state = fetches[future]
+            try:
+                listings = future.result()
+            except Exception as e:
+                log.error(f"Failed to fetch {city}, {state}: {e}")
+                continue
+            write_json(zipcodes[(city, state)], ZIPCODE_FILE.format(date, city))
+            log.info(f"Fetched {len(listings)} listings in {city}, {state}, formatting")
+            exports[formatters.submit(_format_export, city, date, listings, export_format)] = (city, state)
+        for future in as_completed(exports):
+            city, state = exports[future]
+            try:
+                summary[(city, state)] = future.result()
+            except Exception as e:
+                log.error(f"Failed to format {city}, {state}: {e}")
+                continue
+            log.info(f"Exported {city}, {state}: {summary[(city, state)]}")
+    if session.cache:
+        log.info(f"Response cache: {session.cache.stats()}")
+    log.info(f"Session: {session.stats}")
+    return summary
+
+
+def _fetch_city(city: str, zipcodes: List[int], session: Session, concurrency: int = None):
+    log.info(f"Searching {city}")
+    search = Search(zipcodes=zipcodes, session=session)
+    return search.get_all_listings(read_cache=True, concurrency=concurrency)
+
+
+def _format_export(city: str, date: str, listings: List[dict], export_format: str = "csv"):
+    """runs in a formatting process, only the listing counts are sent back"""
+    df = format_data(listings, APARTMENT_URL_FILE.format(date, city))
+    if export_format == "parquet":
+        export_parquet(df, PARQUET_DIR, date)
+    else:
+        export_csv(df, LISTINGS_FILE.format(date, city))
+        export_csv(df[df["status"] == "FOR_SALE"], FOR_SALE_LISTINGS_FILE.format(date, city))
+        export_csv(df[df["status"] == "FOR_RENT"], FOR_RENT_LISTINGS_FILE.format(date, city))
+    return df["status"].value_counts().to_dict()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="export listings for many cities")
+    parser.add_argument("config", help="JSON list of [city, state] pairs")
+    parser.add_argument("--fetch-workers", type=int, default=FETCH_WORKERS)
+    parser.add_argument("--format-workers", type=int, default=os.cpu_count())
+    parser.add_argument("--concurrency", type=int, default=None, help="requests in flight per city")
+    parser.add_argument("--no-cache", action="store_true", help="don't share a response cache")
+    parser.add_argument("--format", choices=["csv", "parquet"], default="csv")
+    args = parser.parse_args()
+    run_batch(load_cities(args.config), args.fetch_workers, args.format_workers, args.concurrency,
+              not args.no_cache, args.format)
@@ -0,0 +1,140 @@
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional
+
+from .cache import HOUR, DAY
+from .file_util import mkdir
+from .metrics import METRICS
+
+log = logging.getLogger(__name__)
+
+"""
+>>> cache = BuildingCache("./data/cache/buildings.db")
+>>> Apartments(urls, building_cache=cache, listing_fingerprints=building_fingerprints(listings)).data()
+>>> cache.stats()
+"""
+
+# building cache defaults
+BUILDING_CACHE_FILE: str = "./data/cache/buildings.db"
+BUILDING_TTL: int = 12 * HOUR  # floor plans are reused without fetching the building page
+UNIT_MAX_AGE: int = 14 * DAY  # unchanged unit details are reused until this old
+BUILDING_MAX_AGE: int = 7 * DAY  # a building unchanged in the search results is reused until this old
+# search result fields of a building that change with its units, prices or availability
+BUILDING_FIELDS = ("statusType", "unformattedPrice", "minBaseRent", "maxBaseRent", "availabilityCount", "units")
+
+
+class BuildingCache:
+    """
+    Persistent building url -> floor plan unit urls, and unit url -> property details
+    a building is stored with a fingerprint of its search result entry, its unit list is reused within building_ttl,
+    or within building_max_age while the search result is unchanged
+    each unit is stored with a fingerprint of its floor plan entry, details are only reused while it matches
+    safe to share between threads
+    """
+
+    def __init__(self, db_file: str = BUILDING_CACHE_FILE, building_ttl: int = BUILDING_TTL,
+                 unit_max_age: int = UNIT_MAX_AGE, building_max_age: int = BUILDING_MAX_AGE):
+        """
+        :param db_file: SQLite file
+        :param building_ttl: seconds a building's unit list is used without fetching the building page
+        :param unit_max_age: seconds unit details are reused while the unit is unchanged, older entries are dropped
+        :param building_max_age: seconds a building's unit list is used while its search result is unchanged
+        """
+        mkdir(db_file)
+        self.building_ttl = building_ttl
+        self.unit_max_age = unit_max_age
+        self.building_max_age = building_max_age
+        self.hits = {"buildings": 0, "units": 0}
+        self.misses = {"buildings": 0, "units": 0}
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_file, check_same_thread=False, isolation_level=None)
+        self._db.execute("CREATE TABLE IF NOT EXISTS buildings "
+                         "(url TEXT PRIMARY KEY, zpid TEXT, units TEXT, fetched REAL, listing TEXT)")
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(buildings)")]
+        if "listing" not in columns:
+            # caches written before search result fingerprints were stored
+            self._db.execute("ALTER TABLE buildings ADD COLUMN listing TEXT")
+        self._db.execute("CREATE TABLE IF NOT EXISTS units "
+                         "(url TEXT PRIMARY KEY, fingerprint TEXT, details BLOB, fetched REAL)")
+        self.prune()
+
+    def building(self, url: str, listing: str = None) -> Optional[Dict[str, str]]:
+        """
+        :param listing: fingerprint of the building's search result entry, see building_fingerprints
+        :return: {unit url: fingerprint} of a building fetched within building_ttl, or within building_max_age with
+            the same search result fingerprint, otherwise None
+        """
+        with self._lock:
+            row = self._db.execute("SELECT units, fetched, listing FROM buildings WHERE url = ?", (url,)).fetchone()
+            age = time.time() - row[1] if row else None
+            unchanged = listing is not None and row is not None and row[2] == listing
+            if not row or not (age <= self.building_ttl or unchanged and age < self.building_max_age):
+                self.misses["buildings"] += 1
+                METRICS.inc("building_cache_total", kind="building", result="miss")
+                return None
+            self.hits["buildings"] += 1
+        METRICS.inc("building_cache_total", kind="building", result="hit")
+        return json.loads(row[0])
+
+    def put_building(self, url: str, zpid, units: Dict[str, str], listing: str = None):
+        with self._lock:
+            self._db.execute("REPLACE INTO buildings VALUES (?, ?, ?, ?, ?)",
+                             (url, str(zpid), json.dumps(units), time.time(), listing))
+
+    def unit(self, url: str, fingerprint: str) -> Optional[dict]:
+        """
+        :return: cached property details when the unit's floor plan entry is unchanged, otherwise None
+        """
+        with self._lock:
+            row = self._db.execute("SELECT fingerprint, details, fetched FROM units WHERE url = ?",
+                                   (url,)).fetchone()
+            if not row or row[0] != fingerprint or time.time() - row[2] > self.unit_max_age:
+                self.misses["units"] += 1
+                METRICS.inc("building_cache_total", kind="unit", result="miss")
+                return None
+            self.hits["units"] += 1
+        METRICS.inc("building_cache_total", kind="unit", result="hit")
+        return json.loads(zlib.decompress(row[1]))
+
+    def put_unit(self, url: str, fingerprint: str, details: dict):
+        compressed = zlib.compress(json.dumps(details).encode())
+        with self._lock:
+            self._db.execute("REPLACE INTO units VALUES (?, ?, ?, ?)", (url, fingerprint, compressed, time.time()))
+
+    def prune(self):
+        """drops units older than unit_max_age and buildings that can no longer be reused"""
+        cutoff = time.time() - self.unit_max_age
+        with self._lock:
+            self._db.execute("DELETE FROM units WHERE fetched < ?", (cutoff,))
+            self._db.execute("DELETE FROM buildings WHERE fetched < ?",
+                             (time.time() - max(self.building_ttl, self.building_max_age),))
+
+    def stats(self):
+        with self._lock:
+            buildings = self._db.execute("SELECT COUNT(*) FROM buildings").fetchone()[0]
+            units = self._db.execute("SELECT COUNT(*) FROM units").fetchone()[0]
+        return {"hits": dict(self.hits), "misses": dict(self.misses), "buildings": buildings, "units": units}
+
+
+def unit_fingerprint(entry: dict) -> str:
+    """hash of a unit or floor plan entry from a building page, changes with its price or availability"""
+    return hashlib.sha1(json.dumps(entry, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def building_fingerprints(listings: List[dict]) -> Dict[str, str]:
+    """
+    :return: {partial building url: hash of the building's BUILDING_FIELDS in the search results}
+    """
+    fingerprints = {}
+    for listing in listings:
+        url = listing.get("detailUrl")
+        if not url or url.startswith("http"):
+            continue
+        fields = json.dumps([listing.get(field) for field in BUILDING_FIELDS], sort_keys=True, default=str)
+        fingerprints[url] = hashlib.sha1(fields.encode()).hexdigest()
+    return fingerprints
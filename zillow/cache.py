@@ -0,0 +1,114 @@
+import logging
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from typing import Dict, Optional
+
+from .file_util import mkdir
+
+log = logging.getLogger(__name__)
+
+"""
+>>> cache = ResponseCache("./data/cache/responses.db", ttls={r"/homedetails/": 7 * DAY})
+>>> Session(cache=cache).get(url)
+>>> cache.stats()
+"""
+
+HOUR: int = 60 * 60
+DAY: int = 24 * HOUR
+
+# cache defaults, ttls are matched in order against the url and the first match wins
+CACHE_FILE: str = "./data/cache/responses.db"
+CACHE_MAX_SIZE: int = 1024 * 1024 * 1024
+CACHE_TTLS: Dict[str, int] = {
+    r"/homes/": 12 * HOUR,  # search pages
+    r"/homedetails/": 7 * DAY,  # units and houses
+    r"": 3 * DAY,  # buildings and anything else
+}
+
+
+class ResponseCache:
+    """
+    Disk cache of response bodies keyed by url
+    bodies are zlib compressed in SQLite, expire by url pattern ttl and are evicted least recently used
+    safe to share between threads
+    """
+
+    def __init__(self, db_file: str = CACHE_FILE, ttls: Dict[str, int] = None, max_size: int = CACHE_MAX_SIZE):
+        """
+        :param db_file: SQLite file
+        :param ttls: {url regex: seconds} checked in order, urls matching nothing never expire
+        :param max_size: total compressed bytes kept before evicting least recently used responses
+        """
+        mkdir(db_file)
+        self.ttls = [(re.compile(pattern), ttl) for pattern, ttl in (CACHE_TTLS if ttls is None else ttls).items()]
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_file, check_same_thread=False, isolation_level=None)
+        self._db.execute("CREATE TABLE IF NOT EXISTS responses "
+                         "(url TEXT PRIMARY KEY, body BLOB, fetched REAL, accessed REAL, size INTEGER)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+        self._size = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+    def ttl(self, url: str) -> Optional[int]:
+        for pattern, ttl in self.ttls:
+            if pattern.search(url):
+                return ttl
+        return None
+
+    def get(self, url: str) -> Optional[bytes]:
+        """
+        :return: cached body or None when missing or expired
+        """
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT body, fetched FROM responses WHERE url = ?", (url,)).fetchone()
+            ttl = self.ttl(url)
+            if not row or (ttl is not None and now - row[1] > ttl):
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE responses SET accessed = ? WHERE url = ?", (now, url))
+            self.hits += 1
+        return zlib.decompress(row[0])
+
+    def put(self, url: str, body: bytes):
+        compressed = zlib.compress(body)
+        now = time.time()
+        with self._lock:
+            self._size -= self._entry_size(url)
+            self._db.execute("REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                             (url, compressed, now, now, len(compressed)))
+            self._size += len(compressed)
+            self._evict()
+
+    def delete(self, url: str):
+        with self._lock:
+            self._size -= self._entry_size(url)
+            self._db.execute("DELETE FROM responses WHERE url = ?", (url,))
+
+    def stats(self):
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+        requests = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_ratio": self.hits / requests if requests else 0.0,
+                "entries": entries, "size": self._size}
+
+    def _entry_size(self, url: str) -> int:
+        row = self._db.execute("SELECT size FROM responses WHERE url = ?", (url,)).fetchone()
+        return row[0] if row else 0
+
+    def _evict(self):
+        while self._size > self.max_size:
+            rows = self._db.execute("SELECT url, size FROM responses ORDER BY accessed LIMIT 100").fetchall()
+            if not rows:
+                break
+            for url, size in rows:
+                self._db.execute("DELETE FROM responses WHERE url = ?", (url,))
+                self._size -= size
+                if self._size <= self.max_size:
+                    break
+            log.debug(f"Evicted cached responses, cache size {self._size} bytes")
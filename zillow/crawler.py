@@ -0,0 +1,85 @@
+import asyncio
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, List
+from urllib.parse import urlparse
+
+log = logging.getLogger(__name__)
+
+"""
+>>> crawler = AsyncCrawler(session.get, max_concurrency=8, per_host=4)
+>>> asyncio.run(crawler.fetch("https://www.zillow.com/homes/for_rent/43085_rb/"))
+>>> map_ordered(Property.fetch, properties, workers=8)
+"""
+
+# concurrency defaults
+MAX_CONCURRENCY: int = 8
+PER_HOST_CONCURRENCY: int = 4
+
+
+class AsyncCrawler:
+    """
+    Runs a blocking fetch function concurrently from asyncio
+    limits in-flight requests globally and per host
+    """
+
+    def __init__(self, fetch: Callable, max_concurrency: int = MAX_CONCURRENCY,
+                 per_host: int = PER_HOST_CONCURRENCY):
+        """
+        :param fetch: blocking function taking a url, e.g. Session.get
+        :param max_concurrency: max in-flight requests across all hosts
+        :param per_host: max in-flight requests to a single host
+        """
+        if max_concurrency < 1 or per_host < 1:
+            raise ValueError("max_concurrency and per_host must be positive")
+        self._fetch = fetch
+        self.max_concurrency = max_concurrency
+        self.per_host = min(per_host, max_concurrency)
+        self._executor = None
+        self._global = None
+        self._hosts = None
+
+    async def __aenter__(self):
+        # semaphores are bound to the running loop, create them inside it
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency)
+        self._global = asyncio.Semaphore(self.max_concurrency)
+        self._hosts = defaultdict(lambda: asyncio.Semaphore(self.per_host))
+        return self
+
+    async def __aexit__(self, *exc):
+        self._executor.shutdown(wait=True)
+        self._executor = None
+
+    async def fetch(self, url: str, *args):
+        """
+        Calls fetch(url, *args) in the worker pool once a global and host slot are free
+        """
+        host = urlparse(url).netloc
+        async with self._hosts[host], self._global:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, self._fetch, url, *args)
+
+
+def map_ordered(func: Callable, items: Iterable, workers: int = 1, default=None) -> List:
+    """
+    Applies func to each item on a thread pool, results keep the input order
+    a failed item is logged and replaced with `default` instead of aborting the batch
+    :param func: blocking function of one argument
+    :param items: inputs
+    :param workers: pool size, 1 runs serially in the calling thread
+    :param default: result for items that raised
+    :return: list of results
+    """
+
+    def safe(item):
+        try:
+            return func(item)
+        except Exception as e:
+            log.error(f"Failed to process: {item} ({e})")
+            return default
+
+    if workers <= 1:
+        return [safe(item) for item in items]
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(safe, items))
@@ -0,0 +1,55 @@
+import threading
+from collections import Counter
+from typing import Hashable, Iterable, List
+
+"""
+Tracks zpids and urls already seen in a run so repeated entities are skipped before they are fetched again
+>>> index = DedupeIndex()
+>>> index.first(LISTING, "12345")
+True
+>>> index.first(LISTING, "12345")
+False
+>>> index.skipped
+Counter({'listing': 1})
+"""
+
+# entity kinds
+LISTING: str = "listing"
+BUILDING: str = "building"
+UNIT: str = "unit"
+
+
+class DedupeIndex:
+    """
+    Set of seen keys per entity kind with a count of skipped repeats, safe to share between threads
+    """
+
+    def __init__(self):
+        self._seen = {}
+        self._lock = threading.Lock()
+        self.skipped = Counter()
+
+    def first(self, kind: str, key: Hashable) -> bool:
+        """
+        :return: True the first time key is seen for kind, False (and counted as skipped) afterwards
+        """
+        with self._lock:
+            seen = self._seen.setdefault(kind, set())
+            if key in seen:
+                self.skipped[kind] += 1
+                return False
+            seen.add(key)
+            return True
+
+    def unique(self, kind: str, items: Iterable, key=None) -> List:
+        """first occurrence of each item in order, key(item) defaults to the item itself"""
+        return [item for item in items if self.first(kind, key(item) if key else item)]
+
+    def stats(self):
+        with self._lock:
+            return {kind: {"seen": len(seen), "skipped": self.skipped[kind]} for kind, seen in self._seen.items()}
+
+
+def listing_key(listing: dict):
+    """zpid, or the detail url for entries without one such as apartment buildings"""
+    return listing.get("zpid") or listing.get("detailUrl")
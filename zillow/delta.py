@@ -0,0 +1,103 @@
+import logging
+import re
+import sqlite3
+import threading
+
+import pandas as pd
+
+from .file_util import mkdir
+
+log = logging.getLogger(__name__)
+
+"""
+Keeps the previous run's listings so a daily run exports what changed
+unchanged apartment buildings are reused from building_cache.BuildingCache
+>>> snapshot = SnapshotStore("./data/snapshots/columbus.db")
+>>> df = format_data(listings, include_apartments=True, building_cache=BuildingCache())
+>>> delta = diff_snapshot(snapshot.listings(), df)
+>>> snapshot.save_listings(df, "20230102")
+"""
+
+SNAPSHOT_FILE: str = "./data/snapshots/{}.db"
+# delta change types
+ADDED: str = "added"
+REMOVED: str = "removed"
+CHANGED: str = "changed"
+
+ZPID_PATTERN = re.compile(r"/(\d+)_zpid")
+
+
+class SnapshotStore:
+    """
+    SQLite state of the last run, one compact row per zpid
+    safe to share between threads
+    """
+
+    def __init__(self, db_file: str):
+        """
+        :param db_file: SQLite file, reuse the same file across runs of a city
+        """
+        mkdir(db_file)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_file, check_same_thread=False, isolation_level=None)
+        self._db.execute("CREATE TABLE IF NOT EXISTS listings "
+                         "(zpid TEXT PRIMARY KEY, url TEXT, status TEXT, listed REAL, run TEXT)")
+        # buildings are kept by the building cache, snapshots written before that stored them here
+        self._db.execute("DROP TABLE IF EXISTS buildings")
+
+    def listings(self) -> pd.DataFrame:
+        """
+        :return: zpid, url, status and listed price of every listing in the last saved run
+        """
+        with self._lock:
+            rows = self._db.execute("SELECT zpid, url, status, listed FROM listings").fetchall()
+        return pd.DataFrame(rows, columns=["zpid", "url", "status", "listed"])
+
+    def save_listings(self, df: pd.DataFrame, run: str):
+        """replaces the stored listings with the formatted listings of this run"""
+        rows = df[["url", "status"]].assign(listed=pd.to_numeric(df["listed"], errors="coerce"),
+                                            zpid=df["url"].map(zpid_from_url)).dropna(subset=["zpid"])
+        rows = rows.drop_duplicates("zpid")
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.execute("DELETE FROM listings")
+            self._db.executemany("INSERT INTO listings VALUES (?, ?, ?, ?, ?)",
+                                 [(zpid, url, status, None if pd.isna(listed) else float(listed), run)
+                                  for url, status, listed, zpid in rows.itertuples(index=False)])
+            self._db.execute("COMMIT")
+
+
+def zpid_from_url(url):
+    """zpid of a homedetails url, e.g. .../12345_zpid/ -> "12345", None for other urls"""
+    match = ZPID_PATTERN.search(url) if isinstance(url, str) else None
+    return match.group(1) if match else None
+
+
+def diff_snapshot(previous: pd.DataFrame, current: pd.DataFrame) -> pd.DataFrame:
+    """
+    Listings added, removed or changed (status or listed price) since the previous run, keyed by zpid
+    :param previous: SnapshotStore.listings()
+    :param current: formatted listings of this run
+    :return: current columns plus zpid, change, previous_status, previous_listed and price_change
+    """
+    current = current.assign(zpid=current["url"].map(zpid_from_url)).dropna(subset=["zpid"])
+    current = current.drop_duplicates("zpid")
+    previous = previous.rename(columns={"url": "previous_url", "status": "previous_status",
+                                        "listed": "previous_listed"})
+    merged = current.merge(previous, on="zpid", how="outer", indicator=True)
+
+    both = merged["_merge"] == "both"
+    same_status = merged["status"] == merged["previous_status"]
+    listed = pd.to_numeric(merged["listed"], errors="coerce")
+    same_price = (listed == merged["previous_listed"]) | (listed.isna() & merged["previous_listed"].isna())
+    merged["change"] = None
+    merged.loc[merged["_merge"] == "left_only", "change"] = ADDED
+    merged.loc[merged["_merge"] == "right_only", "change"] = REMOVED
+    merged.loc[both & ~(same_status & same_price), "change"] = CHANGED
+
+    delta = merged[merged["change"].notna()].copy()
+    delta["url"] = delta["url"].fillna(delta["previous_url"])
+    delta["price_change"] = pd.to_numeric(delta["listed"], errors="coerce") - delta["previous_listed"]
+    delta = delta.drop(columns=["_merge", "previous_url"])
+    log.info(f"Delta since last run: {delta['change'].value_counts().to_dict()}")
+    return delta.reset_index(drop=True)
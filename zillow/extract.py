@@ -0,0 +1,80 @@
+import json
+from typing import Optional, Union
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from .metrics import METRICS
+
+"""
+Locates the JSON payloads embedded in zillow pages with bounded substring scans instead of lazy regexes
+>>> search_results(session.get(url).content)
+>>> building(session.get(url).content)
+>>> property_details(session.get(url).content)
+"""
+
+# orjson is used when installed, it decodes bytes directly
+JSON_BACKEND: str = "orjson" if orjson else "json"
+
+# (start marker, offset of payload from start marker, end marker)
+SEARCH_RESULTS = (b'!--{"queryState"', 3, b'-->')
+BUILDING = (b'{"props":', 0, b'</script>')
+PROPERTY = (b'{"apiCache"', 0, b'</script>')
+
+
+def loads(payload: Union[bytes, str]):
+    if orjson:
+        return orjson.loads(payload)
+    return json.loads(payload)
+
+
+def find_payload(page: Union[bytes, str], start: bytes, offset: int, end: bytes) -> Optional[Union[bytes, str]]:
+    """
+    Slices the payload between the first start marker and the next end marker
+    both lookups are single forward scans, nothing before start or after end is examined
+    :param page: raw page, bytes avoid decoding the whole document
+    :return: payload or None if either marker is missing
+    """
+    if isinstance(page, str):
+        start, end = start.decode(), end.decode()
+    begin = page.find(start)
+    if begin < 0:
+        return None
+    stop = page.find(end, begin + len(start))
+    if stop < 0:
+        return None
+    return page[begin + offset:stop]
+
+
+def extract_json(page: Union[bytes, str], markers: tuple):
+    payload = find_payload(page, *markers)
+    return loads(payload) if payload is not None else None
+
+
+def search_results(page: Union[bytes, str]) -> Optional[dict]:
+    """queryState/cat1 object from a search results page"""
+    with METRICS.timer("parse_seconds", page="search"):
+        return extract_json(page, SEARCH_RESULTS)
+
+
+def building(page: Union[bytes, str]) -> Optional[dict]:
+    """building object from an apartment building page"""
+    with METRICS.timer("parse_seconds", page="building"):
+        data = extract_json(page, BUILDING)
+    if data is None:
+        return None
+    return data.get("props").get("initialData").get("building")
+
+
+def property_details(page: Union[bytes, str]) -> Optional[dict]:
+    """property object from a homedetails page, apiCache is a JSON string keyed by query"""
+    with METRICS.timer("parse_seconds", page="unit"):
+        data = extract_json(page, PROPERTY)
+        if data is None:
+            return None
+        cache = loads(data.get('apiCache'))
+    if len(cache.keys()) >= 2:
+        return cache.get(list(cache.keys())[1]).get('property')
+    return None
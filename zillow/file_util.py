@@ -1,6 +1,14 @@
 import json
+import time
 from pathlib import Path
-from typing import List
+from typing import List, Sequence
+
+from .metrics import METRICS
+
+# columnar export defaults, low cardinality columns are dictionary encoded
+PARTITION_COLUMNS = ["date", "city", "status"]
+CATEGORICAL_COLUMNS = ["status", "home_type", "city", "zipcode"]
+PARQUET_COMPRESSION = "zstd"
 
 
 def mkdir(directory: str):
@@ -22,6 +30,11 @@ def file_exists(file: str):
     return Path(file).exists()
 
 
+def file_age(file: str):
+    """seconds since file was last modified"""
+    return time.time() - Path(file).stat().st_mtime
+
+
 def read_json(file: str):
     if not file:
         return
@@ -33,7 +46,58 @@ def is_json_file(file: str):
     return Path(file).suffix == ".json"
 
 
-def export_csv(df, file: str):
+def export_csv(df, file: str, append: bool = False):
+    """
+    :param append: add rows to an existing file without repeating the header
+    """
     mkdir(file)
-    print(f"Exported: {file}")
-    df.to_csv(file, index=False)
+    if not append:
+        print(f"Exported: {file}")
+    with METRICS.timer("stage_seconds", stage="export_csv"):
+        df.to_csv(file, index=False, mode='a' if append else 'w', header=not append)
+    METRICS.inc("rows_total", len(df), stage="export_csv")
+
+
+def export_parquet(df, directory: str, date: str, partition_cols: Sequence[str] = PARTITION_COLUMNS):
+    """
+    Writes a hive partitioned parquet dataset, e.g. {directory}/date=20230101/city=Columbus/status=FOR_SALE/
+    rewriting a date replaces its partitions
+    :param df: formatted listings
+    :param directory: dataset root shared by all runs
+    :param date: run date, stored as the `date` partition
+    :param partition_cols: partition columns, in directory order
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    df = df.assign(date=date)
+    for column in CATEGORICAL_COLUMNS:
+        if column in df.columns:
+            df[column] = df[column].astype(str).where(df[column].notna()).astype("category")
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    partitioning = ds.partitioning(table.select(list(partition_cols)).schema, flavor="hive")
+    mkdir(directory)
+    print(f"Exported: {directory} (partitioned by {', '.join(partition_cols)})")
+    with METRICS.timer("stage_seconds", stage="export_parquet"):
+        ds.write_dataset(table, directory, format="parquet", partitioning=partitioning,
+                         basename_template="part-{i}.parquet", existing_data_behavior="delete_matching",
+                         file_options=ds.ParquetFileFormat().make_write_options(compression=PARQUET_COMPRESSION))
+    METRICS.inc("rows_total", len(df), stage="export_parquet")
+
+
+def read_parquet(directory: str, columns: List[str] = None, partition_cols: Sequence[str] = PARTITION_COLUMNS,
+                 **partitions):
+    """
+    Reads a dataset written by export_parquet, only matching partitions and requested columns are read
+    >>> read_parquet("./data/results/parquet", columns=["url", "listed"], status="FOR_SALE", date="20230101")
+    """
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+
+    partitioning = ds.partitioning(pa.schema([(column, pa.string()) for column in partition_cols]), flavor="hive")
+    dataset = ds.dataset(directory, format="parquet", partitioning=partitioning)
+    condition = None
+    for column, value in partitions.items():
+        match = ds.field(column) == str(value)
+        condition = match if condition is None else condition & match
+    return dataset.to_table(columns=columns, filter=condition).to_pandas()
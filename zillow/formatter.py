@@ -1,6 +1,11 @@
 import operator  # https://docs.python.org/3/library/operator.html
 from typing import List
+import numpy as np
 import pandas as pd
+from pandas.api.types import is_numeric_dtype
+
+from .metrics import METRICS
+from .projection import project
 
 pd.set_option('display.max_rows', 500)
 pd.set_option('display.max_columns', 500)
@@ -13,10 +18,60 @@ class Formatter:
     """
     generic class to format a pandas dataframe
     all functions mutate dataframe
+    filters and column functions are recorded and run in one pass the next time df is read,
+    filter masks are combined and applied with a single copy
     """
 
     def __init__(self, dict_array: List[dict]):
-        self.df = pd.json_normalize(dict_array)
+        # built lazily, selecting columns first projects only the mapped fields instead of normalizing everything
+        self._records = dict_array
+        self._df = None
+        self._plan = []
+
+    @property
+    def df(self):
+        if self._df is None:
+            with METRICS.timer("stage_seconds", stage="normalize"):
+                records = [record if isinstance(record, dict) else record.to_dict() for record in self._records]
+                self._df, self._records = pd.json_normalize(records), None
+        if self._plan:
+            with METRICS.timer("stage_seconds", stage="format"):
+                self._run_plan()
+        return self._df
+
+    @df.setter
+    def df(self, df):
+        self._df = df
+        self._records = None
+        self._plan = []
+
+    """plan"""
+
+    def add_filter(self, mask_func, kept: bool = False):
+        """
+        :param mask_func: function of the dataframe returning a boolean mask of rows to keep
+        :param kept: pass the mask of rows earlier filters keep as a second argument, None while every row is kept,
+            for filters that depend on other rows, e.g. dropping repeats
+        """
+        self._plan.append((True, mask_func, kept))
+
+    def add_column_step(self, column_func):
+        """
+        :param column_func: function mutating columns of the dataframe in place, must not add or drop rows
+        """
+        self._plan.append((False, column_func, False))
+
+    def _run_plan(self):
+        # masks are positional, steps run in order over all rows and rows are dropped once at the end
+        df, plan, mask = self._df, self._plan, None
+        self._plan = []
+        for is_filter, func, kept in plan:
+            if is_filter:
+                keep = np.asarray(func(df, mask) if kept else func(df), dtype=bool)
+                mask = keep if mask is None else mask & keep
+            else:
+                func(df)
+        self._df = df if mask is None or mask.all() else df.loc[mask]
 
     """helper"""
 
@@ -26,11 +81,16 @@ class Formatter:
     """filter"""
 
     def filter(self, column, op, value):
-        self.df = self.df.loc[op(self.df[column], value)]
+        self.add_filter(lambda df: op(df[column], value))
 
     """columns"""
 
     def select_rename_columns(self, *column_mappings):
+        if self._df is None and not self._plan:
+            with METRICS.timer("stage_seconds", stage="project"):
+                self.df = project(self._records, *column_mappings)
+            METRICS.inc("rows_total", len(self._df), stage="project")
+            return self.df
         df_cols = set(self.columns())
         rename_mapping = {}
         keep_columns = []
@@ -47,13 +107,49 @@ class Formatter:
         return self.df
 
     def new_calc_column(self, column, op, col1, col2):
-        self.df[column] = op(self.df[col1], self.df[col2])
+        def step(df):
+            df[column] = op(df[col1], df[col2])
+
+        self.add_column_step(step)
 
     def apply_column_func(self, column, func, *args):
-        self.df[column] = self.df[column].apply(lambda x: func(x, *args))
+        def step(df):
+            df[column] = df[column].apply(lambda x: func(x, *args))
+
+        self.add_column_step(step)
+
+    def round_column(self, column, decimals):
+        """same values as apply_column_func(column, round, decimals)"""
+
+        def step(df):
+            if not is_numeric_dtype(df[column]):
+                df[column] = df[column].apply(lambda x: round(x, decimals))
+                return
+            values = df[column].to_numpy(dtype=float)
+            rounded = np.round(values, decimals)
+            # scaling can push a value across .5, python's correctly rounded round() settles those few rows
+            scaled = np.abs(values * 10 ** decimals)
+            with np.errstate(invalid='ignore'):
+                near_half = np.abs(scaled - np.floor(scaled) - 0.5) <= scaled * 1e-9
+            rounded[near_half] = [round(x, decimals) for x in values[near_half].tolist()]
+            df[column] = rounded
+
+        self.add_column_step(step)
 
     def filter_apply_column_func(self, column, filter_func, func, *args):
-        self.df.loc[filter_func(self.df[column]), column] = self.df[column].apply(lambda x: func(x, *args))
+        def step(df):
+            mask = filter_func(df[column])
+            df.loc[mask, column] = df.loc[mask, column].apply(lambda x: func(x, *args))
+
+        self.add_column_step(step)
+
+    def filter_prefix_column(self, column, filter_func, prefix):
+        def step(df):
+            mask = filter_func(df[column])
+            # astype(str) formats missing values like an f-string would
+            df.loc[mask, column] = prefix + df.loc[mask, column].astype(str)
+
+        self.add_column_step(step)
 
 
 class ListingFormatter:
@@ -61,8 +157,12 @@ class ListingFormatter:
     Zillow listing specific transformations and filters
     """
 
-    def __init__(self, listings: List[dict]):
-        self.listings = listings
+    def __init__(self, listings: List[dict], keep_raw: bool = True):
+        """
+        :param listings: raw listings or compact records, see record.ListingRecord
+        :param keep_raw: keep a reference to the raw listings so reset() works, False lets them be freed
+        """
+        self.listings = listings if keep_raw else None
         self.fmt = Formatter(listings)
 
     @property
@@ -77,13 +177,15 @@ class ListingFormatter:
         return self.df.head(n)
 
     def reset(self):
+        if self.listings is None:
+            raise ValueError("Raw listings were not kept, create ListingFormatter with keep_raw=True to reset")
         self.fmt = Formatter(self.listings)
 
     def apartment_urls(self):
         return list(self.fmt.df.loc[~self.fmt.df['url'].str.startswith('http')]['url'])
 
     def remove_apartments(self):
-        self.fmt.df = self.df.loc[self.fmt.df['url'].str.startswith('http')]
+        self.fmt.add_filter(lambda df: df['url'].str.startswith('http'))
 
     def concat_df(self, df):
         self.fmt.df = pd.concat([self.fmt.df, df])
@@ -96,8 +198,20 @@ class ListingFormatter:
     def filter_for_sale(self):
         self.fmt.filter('statusType', operator.eq, "FOR_SALE")
 
-    def remove_dupes(self, from_col: str = 'status'):
-        self.fmt.df = self.fmt.df[self.fmt.df[from_col].notna()]
+    def remove_dupes(self, from_col: str = 'status', key_col: str = 'url'):
+        """
+        drops rows missing from_col, then repeats of key_col among the remaining rows keeping the first
+        :param key_col: set to None to keep repeated rows
+        """
+
+        def keep(df, kept):
+            # rows dropped by earlier filters are not the first occurrence of their key
+            valid = df[from_col].notna() if kept is None else df[from_col].notna() & kept
+            if key_col is None:
+                return valid
+            return valid & ~df[key_col].where(valid).duplicated()
+
+        self.fmt.add_filter(keep, kept=True)
 
     """custom columns"""
 
@@ -106,11 +220,10 @@ class ListingFormatter:
 
     def price_per_sqft(self, name="price_per_sqft", price_col='listed', area_col='area'):
         self.fmt.new_calc_column(name, operator.truediv, price_col, area_col)
-        self.fmt.apply_column_func(name, round, 2)
+        self.fmt.round_column(name, 2)
 
     def fix_urls(self, url_col='url'):
-        self.fmt.filter_apply_column_func(url_col, lambda x: ~x.str.startswith('http', na=False),
-                                          lambda url: f"https://www.zillow.com{url}")
+        self.fmt.filter_prefix_column(url_col, lambda x: ~x.str.startswith('http', na=False), "https://www.zillow.com")
 
 
 """formatting listings"""
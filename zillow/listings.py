@@ -1,10 +1,19 @@
-import json
+import asyncio
 import logging
-import re
+import time
 from typing import List
 
-from .file_util import write_json, file_exists, read_json, is_json_file
+import requests
+
+from .crawler import AsyncCrawler, PER_HOST_CONCURRENCY
+from .dedupe import DedupeIndex, LISTING, listing_key
+from .extract import search_results
+from .metrics import METRICS
+from .record import to_records
+from .record_cache import RecordWriter, write_records, read_records, read_index, iter_record_batches, is_record_file, \
+    record_file
 from .session import Session
+from .work_queue import WorkQueue, run_queued, PAGE
 from .zipcode_util import fetch_zipcodes
 
 log = logging.getLogger(__name__)
@@ -13,14 +22,21 @@ log = logging.getLogger(__name__)
 >>> Search("columbus", "ohio")
 >>> Search("Columbus", "OH", exclude_zipcodes=[43085])
 >>> Search(zipcodes=[43085, 43206])
+>>> Search("columbus", "ohio").get_all_listings(concurrency=8)
 """
 
 # output setting defaults
 DATA_DIR: str = "./data"
 CACHE_RAW_ZIPCODES: bool = True
 WRITE_RAW_LISTINGS: bool = False
-RAW_ZIPCODES_FILE: str = "zillow/zipcode/{}.json"
-RAW_LISTINGS_FILE: str = "zillow/listings.json"
+RAW_ZIPCODES_FILE: str = "zillow/zipcode/{}.rec"  # legacy {}.json caches are migrated on read
+RAW_LISTINGS_FILE: str = "zillow/listings.rec"
+ZIPCODE_CACHE_TTL: int = 24 * 60 * 60
+CACHE_BATCH_SIZE: int = 500  # cached listings yielded per page by iter_pages, about a dozen search pages
+
+# pagination retry defaults, only for pages that came back but did not parse, Session retries requests
+PAGE_RETRIES: int = 2
+PAGE_RETRY_DELAY: float = 1.0
 
 
 class Search:
@@ -28,105 +44,332 @@ class Search:
 
     def __init__(self, city: str = None, state: str = None,
                  exclude_zipcodes: List[int] = None,
-                 zipcodes: List[int] = None):
+                 zipcodes: List[int] = None,
+                 session: Session = None,
+                 queue: WorkQueue = None,
+                 dedupe: DedupeIndex = None):
         """
         Search listings by city/state (using zipcode lookup) or a list of zipcodes
         :param city: location used for zipcode lookup
         :param state: location used for zipcode lookup
         :param exclude_zipcodes: list of zipcodes to exclude from city/state zipcode lookup
         :param zipcodes: skip zipcode lookup and only search for specified list
+        :param session: optional shared Session, e.g. with a response cache
+        :param queue: optional persistent work queue, finished pages are replayed instead of fetched
+        :param dedupe: optional index shared with other stages of the run, listings seen there are dropped
         """
+        self.zipcodes = self._search_zipcodes(city, state, exclude_zipcodes, zipcodes)
+        self.output_settings = {}
+        self.set_output_settings()
+        self.session = session if session else Session()
+        self.queue = queue
+        self.dedupe = dedupe
+
+    def _search_zipcodes(self, city: str, state: str, exclude_zipcodes: List[int], zipcodes: List[int]):
         # user input should be either city/state or [zipcodes]
         if not (city and state) and not zipcodes or (city and state and zipcodes):
             raise TypeError("Specify *either* city and state or a list of zipcodes to search.")
-        self.zipcodes = zipcodes if zipcodes else fetch_zipcodes(city, state, exclude_zipcodes)
-        log.info(f"Searching {len(self.zipcodes)} zipcodes: {self.zipcodes}")
-        self.output_settings = {}
-        self.set_output_settings()
-        self.session = Session()
+        zipcodes = zipcodes if zipcodes else fetch_zipcodes(city, state, exclude_zipcodes)
+        log.info(f"Searching {len(zipcodes)} zipcodes: {zipcodes}")
+        return zipcodes
 
     def set_output_settings(self, data_dir: str = DATA_DIR,
                             cache_raw_zipcodes: bool = CACHE_RAW_ZIPCODES,
                             raw_zipcode_file: str = RAW_ZIPCODES_FILE,
                             write_raw_listings: bool = WRITE_RAW_LISTINGS,
-                            raw_listings_file: str = RAW_LISTINGS_FILE):
+                            raw_listings_file: str = RAW_LISTINGS_FILE,
+                            zipcode_cache_ttl: int = ZIPCODE_CACHE_TTL):
         """
         Controls file output settings, call before fetching listings to update
         :param data_dir: root dir for all other paths
-        :param cache_raw_zipcodes: boolean to write each zipcode listings from zillow
-        :param raw_zipcode_file: relative path for zipcode files
-        :param write_raw_listings: boolean to write all raw results for Search zipcodes
-        :param raw_listings_file: relative path for raw listings
+        :param cache_raw_zipcodes: boolean to write each zipcode listings from zillow, only the compact record fields
+            unless write_raw_listings is set
+        :param raw_zipcode_file: relative path for zipcode record files, see record_cache, a legacy .json path is
+            replaced by its .rec sibling and its caches are migrated on read
+        :param write_raw_listings: boolean to write all raw results for Search zipcodes, listings keep their full raw
+            payload in memory only when set
+        :param raw_listings_file: relative path for the raw listings record file, .json paths as above
+        :param zipcode_cache_ttl: seconds a zipcode file is read from cache, None to never expire
         """
         data_dir = f"{data_dir}/" if data_dir[-1] != "/" else data_dir
-        if not is_json_file(raw_zipcode_file) or not is_json_file(raw_listings_file):
-            raise TypeError("raw_zipcode_file and raw_listings_file must be relative paths to JSON files")
+        raw_zipcode_file, raw_listings_file = record_file(raw_zipcode_file), record_file(raw_listings_file)
+        if not is_record_file(raw_zipcode_file) or not is_record_file(raw_listings_file):
+            raise TypeError("raw_zipcode_file and raw_listings_file must be relative paths to .rec or legacy .json files")
         self.output_settings = {"write_raw_zipcodes": cache_raw_zipcodes,
                                 "write_raw_listings": write_raw_listings,
                                 "raw_zipcode_file": data_dir + raw_zipcode_file,
-                                "raw_listings_file": data_dir + raw_listings_file}
+                                "raw_listings_file": data_dir + raw_listings_file,
+                                "zipcode_cache_ttl": zipcode_cache_ttl}
         self.print_output_settings()
 
-    def get_all_listings(self, read_cache: bool = False):
+    def get_all_listings(self, read_cache: bool = False, concurrency: int = None,
+                         per_host: int = PER_HOST_CONCURRENCY):
         """
         Returns all FOR_SALE/FOR_RENT listings for zipcodes in Search
         :param read_cache: read zipcode intermediary files if exists to reduce calls to zillow
+        :param concurrency: crawl zipcodes, statuses and pages concurrently with at most this many requests in flight
+        :param per_host: max requests in flight to a single host when crawling concurrently
         :return:
         """
-        listings = []
-        for zc in self.zipcodes:
-            listings.extend(self._zipcode_listings(zc, read_cache))
+        if concurrency:
+            listings = asyncio.run(self._crawl_all_listings(read_cache, concurrency, per_host))
+            # zipcodes overlap, keep the first occurrence in crawl order like the serial path
+            listings = self._dedupe_index().unique(LISTING, listings, listing_key)
+        else:
+            listings = [listing for page in self.iter_pages(read_cache) for listing in page]
         if self.output_settings.get("write_raw_listings"):
-            write_json(listings, self.output_settings.get("raw_listings_file"))
+            write_records(listings, self.output_settings.get("raw_listings_file"))
         return listings
 
+    def iter_pages(self, read_cache: bool = False):
+        """
+        Yields FOR_RENT/FOR_SALE listings page by page for zipcodes in Search, as soon as each page is fetched
+        :param read_cache: read zipcode intermediary files if exists to reduce calls to zillow
+        :return: generator of listing lists, a listing already returned for another zipcode is dropped
+        """
+        index = self._dedupe_index()
+        for zc in self.zipcodes:
+            for page in self._iter_zipcode_pages(zc, read_cache):
+                yield index.unique(LISTING, page, listing_key)
+        log.info(f"Skipped {index.skipped[LISTING]} listings repeated across zipcodes")
+
     def _zipcode_listings(self, zipcode: int, read_cache: bool):
+        return [listing for page in self._iter_zipcode_pages(zipcode, read_cache) for listing in page]
+
+    def _iter_zipcode_pages(self, zipcode: int, read_cache: bool):
         cache_file = self.output_settings.get("raw_zipcode_file").format(zipcode)
-        if read_cache and file_exists(cache_file):
+        if read_cache and self._cache_fresh(cache_file):
             log.info(f"Reading from cached file: {cache_file}")
-            return read_json(cache_file)
+            for batch in iter_record_batches(cache_file, CACHE_BATCH_SIZE):
+                yield self._records(batch)
+            return
 
         log.info(f'Scraping listings in {zipcode}')
-        for_rent = self._scrape_results(f"{self.BASE_URL}/homes/for_rent/{zipcode}_rb/")
+        # pages are appended to the cache as they are fetched instead of holding the zipcode's listings
+        writer = RecordWriter(cache_file) if self.output_settings.get("write_raw_zipcodes") else None
+        complete = False
+        try:
+            fetched_all = True
+            for status in ("for_rent", "for_sale"):
+                tally = _Tally(writer)
+                fetched_all &= yield from self._iter_pages(f"{self.BASE_URL}/homes/{status}/{zipcode}_rb/", acc=tally)
+                log.info(f'Listings {status.upper()} in {zipcode}: {tally.count}')
+            complete = fetched_all
+        finally:
+            # a partial or abandoned zipcode is not cached, so the next run fetches it again
+            if writer and complete:
+                writer.close()
+            elif writer:
+                writer.abort()
+
+    def _dedupe_index(self):
+        # a fresh index per crawl unless one is shared for the whole run
+        return self.dedupe if self.dedupe is not None else DedupeIndex()
+
+    def _records(self, listings: List[dict]):
+        # full raw payloads are only held for raw output, see record.ListingRecord
+        return to_records(listings, keep_raw=self.output_settings.get("write_raw_listings"))
+
+    def _cache_fresh(self, cache_file: str):
+        # age is the fetch time stored in the record index, migrating a legacy JSON cache keeps its mtime
+        index = read_index(cache_file)
+        if index is None:
+            return False
+        if index.get("compact") and self.output_settings.get("write_raw_listings"):
+            log.info(f"Cached file only has record fields, fetching raw listings: {cache_file}")
+            return False
+        ttl = self.output_settings.get("zipcode_cache_ttl")
+        return ttl is None or time.time() - index["fetched"] < ttl
+
+    def _scrape_results(self, url):
+        return [listing for page in self._iter_pages(url) for listing in page]
+
+    def _iter_pages(self, url, retries: int = PAGE_RETRIES, acc: list = None):
+        """
+        Follows pagination from url while nextUrl is set, yielding each page of listResults
+        a page failing after retries ends pagination, pages already yielded are kept
+        :param acc: optional list (or anything with extend) extended with each page as it is yielded
+        :return: generator of listing lists, returns True when every page was fetched
+        """
+        fetched = 0
+        while url:
+            page = self._fetch_page_retry(url, retries)
+            if page is None:
+                return False
+            fetched += len(page.get("results"))
+            if acc is not None:
+                acc.extend(page.get("results"))
+            log.debug(f'Progress: {page.get("current_page")} of {page.get("total_pages")} pages '
+                      f'({fetched} of {page.get("total_listings")} listings)')
+            yield page.get("results")
+            url = self._next_url(page)
+        return True
+
+    def _next_url(self, page):
+        """url of the page after page from its nextUrl, None on the last page"""
+        if page.get("next_url") and page.get("current_page") < page.get("total_pages"):
+            return f"{self.BASE_URL}{page.get('next_url')}"
+        return None
+
+    def _fetch_page_retry(self, url, retries: int = PAGE_RETRIES):
+        """
+        Fetches a search results page, retrying pages that did not parse
+        blocked and failed requests are not retried here, the session already retried them with backoff
+        :return: parsed page with compact listing records or None when every attempt failed
+        """
+        for attempt in range(retries + 1):
+            try:
+                page = self._fetch_queued_page(url)
+            except requests.RequestException as e:
+                log.error(f"Failed to scrape: {url} ({e})")
+                return None
+            except Exception as e:
+                log.warning(f"Failed to scrape: {url} (attempt {attempt + 1} of {retries + 1}: {e})")
+                if attempt < retries:
+                    time.sleep(PAGE_RETRY_DELAY)
+                continue
+            return page
+        log.error(f"Failed to scrape: {url}")
+        return None
+
+    def _fetch_queued_page(self, url):
+        """
+        _fetch_page through the work queue, which stores each page as JSON: the records' compact dicts unless raw
+        listings are kept, a page replayed from a compact run is fetched again when raw output is requested
+        """
+        if self.queue is None:
+            return self._fetch_page(url)
+        page = run_queued(self.queue, PAGE, url, self._json_page, url)
+        if page is None:
+            return None
+        if page.get("compact") and self.output_settings.get("write_raw_listings"):
+            return self._fetch_page(url)
+        return {**page, "results": self._records(page.get("results"))}
+
+    def _json_page(self, url):
+        page = self._fetch_page(url)
+        return {**page, "results": [record.to_dict() for record in page.get("results")],
+                "compact": not self.output_settings.get("write_raw_listings")}
+
+    def _fetch_page(self, url):
+        """
+        Fetches and parses a single search results page
+        :return: dict of listing records and pagination state
+        """
+        with METRICS.timer("stage_seconds", stage="search_page"):
+            data = search_results(self.session.get(url).content)
+        if not data:
+            self.session.invalidate(url)
+            raise Exception("Bad result from Zillow", url)
+        """control pagination"""
+        current_page = data.get("queryState").get("pagination").get("currentPage") if "pagination" in data.get(
+            "queryState") else 1
+        total_pages = data.get('cat1').get("searchList").get("totalPages")
+        next_url = data.get('cat1').get("searchList").get("pagination").get('nextUrl') if "pagination" in data.get(
+            'cat1').get("searchList") else None
+        total_listings = data.get("cat1").get("searchList").get("totalResultCount")
+        """results"""
+        results = data.get('cat1').get("searchResults").get("listResults")
+        METRICS.inc("rows_total", len(results), stage="search")
+        # listings become records as soon as the page parses, so the nested page is not held
+        return {"results": self._records(results),
+                "current_page": current_page,
+                "total_pages": total_pages,
+                "next_url": next_url,
+                "total_listings": total_listings}
+
+    """concurrent crawl"""
+
+    async def _crawl_all_listings(self, read_cache: bool, concurrency: int, per_host: int):
+        async with AsyncCrawler(self._fetch_page_retry, concurrency, per_host) as crawler:
+            results = await asyncio.gather(*[self._crawl_zipcode(zc, read_cache, crawler) for zc in self.zipcodes])
+        return [listing for zipcode_listings in results for listing in zipcode_listings]
+
+    async def _crawl_zipcode(self, zipcode: int, read_cache: bool, crawler: AsyncCrawler):
+        cache_file = self.output_settings.get("raw_zipcode_file").format(zipcode)
+        if read_cache and self._cache_fresh(cache_file):
+            log.info(f"Reading from cached file: {cache_file}")
+            return self._records(read_records(cache_file))
+
+        log.info(f'Scraping listings in {zipcode}')
+        (for_rent, rent_complete), (for_sale, sale_complete) = await asyncio.gather(
+            self._crawl_results(f"{self.BASE_URL}/homes/for_rent/{zipcode}_rb/", crawler),
+            self._crawl_results(f"{self.BASE_URL}/homes/for_sale/{zipcode}_rb/", crawler))
         log.info(f'Listings FOR_RENT in {zipcode}: {len(for_rent)}')
-        for_sale = self._scrape_results(f"{self.BASE_URL}/homes/for_sale/{zipcode}_rb/")
         log.info(f'Listings FOR_SALE in {zipcode}: {len(for_sale)}')
         listings = for_rent + for_sale
 
-        if self.output_settings.get("write_raw_zipcodes"):
-            write_json(listings, cache_file)
+        if self.output_settings.get("write_raw_zipcodes") and rent_complete and sale_complete:
+            write_records(listings, cache_file)
         return listings
 
-    def _scrape_results(self, url, acc=None):
-        if acc is None:
-            acc = []
-        try:
-            page_text = self.session.get(url).text
-            query_state = re.search(r'!--(\{"queryState".*?)-->', page_text)
-            if not query_state:
-                raise Exception("Bad result from Zillow", page_text)
-            data = json.loads(query_state.group(1))
-            """control pagination"""
-            current_page = data.get("queryState").get("pagination").get("currentPage") if "pagination" in data.get(
-                "queryState") else 1
-            total_pages = data.get('cat1').get("searchList").get("totalPages")
-            next_url = data.get('cat1').get("searchList").get("pagination").get('nextUrl') if "pagination" in data.get(
-                'cat1').get("searchList") else None
-            total_listings = data.get("cat1").get("searchList").get("totalResultCount")
-            """results"""
-            res = data.get('cat1').get("searchResults").get("listResults")
-            acc.extend(res)
-            log.debug(f'Progress: {current_page} of {total_pages} pages ({len(acc)} of {total_listings} listings)')
-            if next_url and current_page < total_pages:
-                return self._scrape_results(f"{self.BASE_URL}{next_url}", acc)
-            # assert len(acc) == total_listings
-            return acc
-        except Exception as e:
-            log.error(f"Failed to scrape: {url}", e)
-            return []
+    async def _crawl_results(self, url: str, crawler: AsyncCrawler):
+        """
+        Fetches the first page to learn the page count, then all remaining pages at once, see page_url
+        falls back to following nextUrl page by page when zillow's pages are not in that format
+        :return: listings and whether every page was fetched
+        """
+        first = await crawler.fetch(url)
+        if first is None:
+            return [], False
+        next_url = self._next_url(first)
+        if next_url is None:
+            return first.get("results"), True
+
+        numbers = range(first.get("current_page") + 1, first.get("total_pages") + 1)
+        page_urls = [page_url(url, number) for number in numbers]
+        if page_urls[0] != next_url:
+            log.warning(f"Unexpected nextUrl {next_url}, following pages one by one: {url}")
+            return await self._follow_results(first, crawler)
+        pages = await asyncio.gather(*[crawler.fetch(page_url) for page_url in page_urls])
+        if any(page is not None and page.get("current_page") != number for page, number in zip(pages, numbers)):
+            log.warning(f"Pages do not match their urls, following nextUrl instead: {url}")
+            return await self._follow_results(first, crawler)
+        acc = list(first.get("results"))
+        for page in pages:
+            if page is not None:
+                acc.extend(page.get("results"))
+        log.debug(f'Fetched {len(acc)} of {first.get("total_listings")} listings: {url}')
+        return acc, None not in pages
+
+    async def _follow_results(self, page, crawler: AsyncCrawler):
+        """
+        Follows nextUrl from an already fetched page, like the serial crawl
+        :return: listings and whether every page was fetched
+        """
+        acc = list(page.get("results"))
+        url = self._next_url(page)
+        while url:
+            page = await crawler.fetch(url)
+            if page is None:
+                return acc, False
+            acc.extend(page.get("results"))
+            url = self._next_url(page)
+        return acc, True
 
     def print_output_settings(self):
         log.info(f"OUTPUT SETTINGS:\n\tCache raw listings by zipcode:\t"
                  f" {self.output_settings.get('write_raw_zipcodes')} ({self.output_settings.get('raw_zipcode_file')})"
                  f"\n\tWrite all raw listings:\t\t\t {self.output_settings.get('write_raw_listings')} "
                  f"({self.output_settings.get('raw_listings_file')})")
+
+
+class _Tally:
+    """acc for _iter_pages counting listings and appending them to an optional RecordWriter"""
+
+    def __init__(self, writer: RecordWriter = None):
+        self.writer = writer
+        self.count = 0
+
+    def extend(self, listings: List):
+        self.count += len(listings)
+        if self.writer:
+            self.writer.extend(listings)
+
+
+def page_url(url: str, page: int) -> str:
+    """
+    url of a results page in zillow's usual nextUrl format, {url}{page}_p/, lets the concurrent crawl fetch every page
+    at once, it is checked against the first page's nextUrl so both crawl modes key work queue pages by the same url
+    """
+    return url if page <= 1 else f"{url}{page}_p/"
@@ -0,0 +1,187 @@
+import asyncio
+import json
+import logging
+from collections import namedtuple
+from typing import List
+from urllib.parse import quote
+
+from .crawler import AsyncCrawler, PER_HOST_CONCURRENCY
+from .dedupe import DedupeIndex, LISTING, listing_key
+from .listings import Search
+from .record_cache import write_records
+from .session import Session
+from .work_queue import WorkQueue
+from .zipcode_util import lookup_zipcodes
+
+log = logging.getLogger(__name__)
+
+"""
+Covers a city by map bounds instead of zipcodes, splitting a region into quadrants only while it has more
+results than pagination returns
+>>> MapSearch("columbus", "ohio").get_all_listings()
+>>> MapSearch(bounds=Bounds(north=40.16, south=39.81, east=-82.77, west=-83.21), max_results=800)
+"""
+
+# zillow serves at most 20 pages of 40 results for one search
+PAGINATION_CAP: int = 800
+# regions narrower than this (degrees) in both directions are not split further
+MIN_SPAN: float = 0.002
+STATUSES = ("for_rent", "for_sale")
+FILTER_STATE = {
+    "for_rent": {"fr": {"value": True}, "fsba": {"value": False}, "fsbo": {"value": False}, "nc": {"value": False},
+                 "cmsn": {"value": False}, "auc": {"value": False}, "fore": {"value": False}},
+    "for_sale": {},
+}
+
+Bounds = namedtuple("Bounds", ["north", "south", "east", "west"])
+
+
+class MapSearch(Search):
+
+    def __init__(self, city: str = None, state: str = None, bounds: Bounds = None,
+                 session: Session = None,
+                 queue: WorkQueue = None,
+                 dedupe: DedupeIndex = None,
+                 max_results: int = PAGINATION_CAP,
+                 min_span: float = MIN_SPAN):
+        """
+        Search listings in map bounds, by default the bounding box of a city/state's standard zipcodes
+        :param city: location used for zipcode bounds lookup
+        :param state: location used for zipcode bounds lookup
+        :param bounds: skip the lookup and search these bounds
+        :param session: optional shared Session, e.g. with a response cache
+        :param queue: optional persistent work queue, finished pages are replayed instead of fetched
+        :param dedupe: optional index shared with other stages of the run, listings seen there are dropped
+        :param max_results: results pagination can return, regions with more are split into quadrants
+        :param min_span: regions smaller than this many degrees are not split, their extra results are lost
+        """
+        self.bounds = bounds
+        super().__init__(city, state, session=session, queue=queue, dedupe=dedupe)
+        self.max_results = max_results
+        self.min_span = min_span
+        self.stats = {"regions": 0, "splits": 0, "pages": 0}
+
+    def _search_zipcodes(self, city: str, state: str, exclude_zipcodes: List[int], zipcodes: List[int]):
+        # zipcodes are only looked up for their bounds, the search itself covers self.bounds
+        if not (city and state) and not self.bounds or (city and state and self.bounds):
+            raise TypeError("Specify *either* city and state or map bounds to search.")
+        zipcodes = lookup_zipcodes(city, state) if city else []
+        self.bounds = self.bounds if self.bounds else zipcode_bounds(zipcodes)
+        log.info(f"Searching map bounds: {self.bounds}")
+        return [zc.zipcode for zc in zipcodes]
+
+    def get_all_listings(self, read_cache: bool = False, concurrency: int = None,
+                         per_host: int = PER_HOST_CONCURRENCY):
+        """
+        Returns all FOR_SALE/FOR_RENT listings in the search bounds
+        :param read_cache: unused, regions have no intermediary files, use a Session response cache instead
+        :param concurrency: crawl regions and pages concurrently with at most this many requests in flight
+        :param per_host: max requests in flight to a single host when crawling concurrently
+        """
+        if concurrency:
+            listings = asyncio.run(self._crawl_all_bounds(concurrency, per_host))
+            listings = self._dedupe_index().unique(LISTING, listings, listing_key)
+        else:
+            listings = [listing for page in self.iter_pages(read_cache) for listing in page]
+        log.info(f"Map search: {self.stats}")
+        if self.output_settings.get("write_raw_listings"):
+            write_records(listings, self.output_settings.get("raw_listings_file"))
+        return listings
+
+    def iter_pages(self, read_cache: bool = False):
+        """
+        Yields FOR_RENT/FOR_SALE listings page by page as each page is fetched
+        :return: generator of listing lists, a listing already returned for an overlapping region is dropped
+        """
+        index = self._dedupe_index()
+        for status in STATUSES:
+            for page in self._iter_region_pages(self.bounds, status):
+                yield index.unique(LISTING, page, listing_key)
+        log.info(f"Skipped {index.skipped[LISTING]} listings repeated across regions")
+
+    def search_url(self, bounds: Bounds, status: str, page: int = 1):
+        query = {"pagination": {"currentPage": page} if page > 1 else {},
+                 "mapBounds": bounds._asdict(),
+                 "isMapVisible": True,
+                 "filterState": FILTER_STATE[status]}
+        return f"{self.BASE_URL}/homes/{status}/?searchQueryState={quote(json.dumps(query, separators=(',', ':')))}"
+
+    def _should_split(self, first: dict, bounds: Bounds):
+        if first.get("total_listings") is None or first.get("total_listings") <= self.max_results:
+            return False
+        if bounds.north - bounds.south < self.min_span and bounds.east - bounds.west < self.min_span:
+            log.warning(f"Region at minimum size still has {first.get('total_listings')} results: {bounds}")
+            return False
+        self.stats["splits"] += 1
+        return True
+
+    def _iter_region_pages(self, bounds: Bounds, status: str):
+        """
+        Yields the first page of a region, then either its quadrants' pages or its remaining pages
+        the first page of a split region is kept, its listings reappear in the quadrants and are deduped
+        """
+        self.stats["regions"] += 1
+        first = self._fetch_page_retry(self.search_url(bounds, status))
+        if first is None:
+            return
+        self.stats["pages"] += 1
+        yield first.get("results")
+        if self._should_split(first, bounds):
+            for quadrant in split_bounds(bounds):
+                yield from self._iter_region_pages(quadrant, status)
+            return
+        for page_num in range(first.get("current_page") + 1, first.get("total_pages") + 1):
+            page = self._fetch_page_retry(self.search_url(bounds, status, page_num))
+            if page is None:
+                return
+            self.stats["pages"] += 1
+            yield page.get("results")
+
+    """concurrent crawl"""
+
+    async def _crawl_all_bounds(self, concurrency: int, per_host: int):
+        async with AsyncCrawler(self._fetch_page_retry, concurrency, per_host) as crawler:
+            results = await asyncio.gather(*[self._crawl_region(self.bounds, status, crawler)
+                                             for status in STATUSES])
+        return [listing for status_listings in results for listing in status_listings]
+
+    async def _crawl_region(self, bounds: Bounds, status: str, crawler: AsyncCrawler):
+        """
+        Fetches the first page of a region, then all quadrants or all remaining pages at once
+        :return: listings in the same order as _iter_region_pages
+        """
+        self.stats["regions"] += 1
+        first = await crawler.fetch(self.search_url(bounds, status))
+        if first is None:
+            return []
+        self.stats["pages"] += 1
+        acc = list(first.get("results"))
+        if self._should_split(first, bounds):
+            quadrants = await asyncio.gather(*[self._crawl_region(quadrant, status, crawler)
+                                               for quadrant in split_bounds(bounds)])
+            return acc + [listing for listings in quadrants for listing in listings]
+        pages = await asyncio.gather(*[crawler.fetch(self.search_url(bounds, status, page_num))
+                                       for page_num in range(first.get("current_page") + 1,
+                                                             first.get("total_pages") + 1)])
+        for page in pages:
+            if page is not None:
+                self.stats["pages"] += 1
+                acc.extend(page.get("results"))
+        return acc
+
+
+def zipcode_bounds(zipcodes) -> Bounds:
+    """bounding box around zipcode bounds, e.g. lookup_zipcodes(city, state)"""
+    zipcodes = [zc for zc in zipcodes if None not in (zc.north, zc.south, zc.east, zc.west)]
+    if not zipcodes:
+        raise ValueError("No zipcode bounds found to search")
+    return Bounds(north=max(zc.north for zc in zipcodes), south=min(zc.south for zc in zipcodes),
+                  east=max(zc.east for zc in zipcodes), west=min(zc.west for zc in zipcodes))
+
+
+def split_bounds(bounds: Bounds) -> List[Bounds]:
+    """quadrants in NW, NE, SW, SE order"""
+    lat = (bounds.north + bounds.south) / 2
+    lng = (bounds.east + bounds.west) / 2
+    return [Bounds(bounds.north, lat, lng, bounds.west), Bounds(bounds.north, lat, bounds.east, lng),
+            Bounds(lat, bounds.south, lng, bounds.west), Bounds(lat, bounds.south, bounds.east, lng)]
@@ -0,0 +1,189 @@
+import json
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Dict, Tuple
+
+"""
+Run instrumentation, disabled by default so instrumented code only pays an attribute check
+>>> METRICS.enable()
+>>> with METRICS.timer("request_seconds", page="search"): ...
+>>> METRICS.inc("rows_total", 40, stage="search")
+>>> METRICS.write_report("./data/results/20230101/columbus-metrics.json")
+>>> METRICS.write_prometheus("./data/results/20230101/columbus-metrics.prom")
+"""
+
+# histogram upper bounds in seconds, wide enough for both parse times and slow requests
+BUCKETS: Tuple[float, ...] = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PREFIX: str = "zillow_"
+
+_DISABLED = nullcontext()
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last bucket is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float):
+        """upper bound of the bucket holding the q-th observation, None when empty or above the last bucket"""
+        if not self.count:
+            return None
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return None
+
+    def to_dict(self):
+        return {"count": self.count, "sum": self.sum, "mean": self.sum / self.count if self.count else None,
+                "p50": self.quantile(0.5), "p95": self.quantile(0.95),
+                "buckets": dict(zip([*map(str, self.buckets), "+Inf"], self.counts))}
+
+
+class Registry:
+    """
+    Counters and histograms keyed by name and labels, safe to share between threads
+    every method returns immediately while disabled
+    """
+
+    def __init__(self, enabled: bool = False):
+        self.enabled = enabled
+        self.started = time.time()
+        self._counters: Dict[tuple, float] = {}
+        self._histograms: Dict[tuple, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def enable(self):
+        self.reset()
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self.started = time.time()
+
+    def inc(self, name: str, value: float = 1, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        if not self.enabled:
+            return
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(value)
+
+    def timer(self, name: str, **labels):
+        """context manager observing its duration in seconds"""
+        if not self.enabled:
+            return _DISABLED
+        return self._timer(name, labels)
+
+    @contextmanager
+    def _timer(self, name: str, labels: dict):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def counter(self, name: str, **labels) -> float:
+        """sum of the counter over every label set that includes labels"""
+        wanted = set(labels.items())
+        with self._lock:
+            return sum(value for (counter, counter_labels), value in self._counters.items()
+                       if counter == name and wanted.issubset(counter_labels))
+
+    def report(self) -> dict:
+        """
+        :return: {"duration": seconds, "cache_hit_ratio": ..., "cache_hit_ratio_by_page": {page: ...},
+            "counters": [...], "histograms": [...]}
+        """
+        with self._lock:
+            counters = [{"name": name, "labels": dict(labels), "value": value}
+                        for (name, labels), value in sorted(self._counters.items())]
+            histograms = [{"name": name, "labels": dict(labels), **histogram.to_dict()}
+                          for (name, labels), histogram in sorted(self._histograms.items())]
+        pages = sorted({counter["labels"]["page"] for counter in counters
+                        if counter["name"] == "cache_requests_total" and "page" in counter["labels"]})
+        return {"started": self.started, "duration": time.time() - self.started,
+                "cache_hit_ratio": self._hit_ratio(),
+                "cache_hit_ratio_by_page": {page: self._hit_ratio(page=page) for page in pages},
+                "counters": counters, "histograms": histograms}
+
+    def _hit_ratio(self, **labels):
+        hits = self.counter("cache_requests_total", result="hit", **labels)
+        misses = self.counter("cache_requests_total", result="miss", **labels)
+        return hits / (hits + misses) if hits + misses else None
+
+    def prometheus(self) -> str:
+        """text exposition format, counters as *_total and histograms as *_bucket/_sum/_count"""
+        lines = []
+        with self._lock:
+            for name in sorted({name for name, _ in self._counters}):
+                lines.append(f"# TYPE {PREFIX}{name} counter")
+                for (counter, labels), value in sorted(self._counters.items()):
+                    if counter == name:
+                        lines.append(f"{PREFIX}{name}{_labels(labels)} {value}")
+            for name in sorted({name for name, _ in self._histograms}):
+                lines.append(f"# TYPE {PREFIX}{name} histogram")
+                for (histogram_name, labels), histogram in sorted(self._histograms.items()):
+                    if histogram_name != name:
+                        continue
+                    cumulative = 0
+                    for bound, count in zip([*map(str, histogram.buckets), "+Inf"], histogram.counts):
+                        cumulative += count
+                        lines.append(f"{PREFIX}{name}_bucket{_labels(labels + (('le', bound),))} {cumulative}")
+                    lines.append(f"{PREFIX}{name}_sum{_labels(labels)} {histogram.sum}")
+                    lines.append(f"{PREFIX}{name}_count{_labels(labels)} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def write_report(self, file: str):
+        Path(file).parent.mkdir(parents=True, exist_ok=True)
+        with open(file, 'w') as f:
+            json.dump(self.report(), f, indent=2)
+
+    def write_prometheus(self, file: str):
+        Path(file).parent.mkdir(parents=True, exist_ok=True)
+        with open(file, 'w') as f:
+            f.write(self.prometheus())
+
+
+def _labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+def page_type(url: str) -> str:
+    """search, unit or building, the label used for request and parse metrics"""
+    if "/homes/" in url:
+        return "search"
+    if "/homedetails/" in url:
+        return "unit"
+    return "building"
+
+
+# process wide registry used by the instrumented modules
+METRICS = Registry()
@@ -0,0 +1,157 @@
+import logging
+from typing import Iterable, List
+
+import pandas as pd
+
+from .building_cache import building_fingerprints
+from .dedupe import DedupeIndex
+from .file_util import export_csv, write_json
+from .formatter import ListingFormatter, DETAILS, ADDRESS, HOME, DETAILS_APT, ADDRESS_APT, HOME_APT
+from .listings import Search
+from .property import Apartments
+from .store import COLUMNS
+
+log = logging.getLogger(__name__)
+
+"""
+Streams search pages through formatting and export in fixed size chunks, memory depends on chunk_size
+fetched zipcodes are appended to their cache page by page and cached ones read in batches, see Search.iter_pages
+>>> stats = stream_export(Search("columbus", "ohio"), "listings.csv", "for-sale.csv", "for-rent.csv")
+>>> stats.by_status()
+"""
+
+CHUNK_SIZE: int = 5000
+
+
+def iter_chunks(pages: Iterable[List[dict]], chunk_size: int = CHUNK_SIZE):
+    """regroups pages of listings into lists of at most chunk_size listings"""
+    chunk = []
+    for page in pages:
+        for listing in page:
+            chunk.append(listing)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+def format_chunk(listings: List[dict], apartment_urls: list = None, include_apartments=False, workers=1,
+                 session=None, queue=None, dedupe=None, building_cache=None):
+    """
+    format_data for one chunk, raw listings are not kept once projected
+    :param apartment_urls: list extended with the chunk's apartment building urls
+    :param dedupe: index shared across chunks so buildings and units are fetched once per run
+    :param building_cache: optional BuildingCache, unchanged buildings and units are not fetched again
+    """
+    fingerprints = building_fingerprints(listings) if include_apartments and building_cache else None
+    data = ListingFormatter(listings, keep_raw=False)
+    data.select(DETAILS, ADDRESS, HOME)
+
+    """apartments"""
+    urls = data.apartment_urls()
+    if apartment_urls is not None:
+        apartment_urls.extend(urls)
+
+    data.remove_apartments()
+
+    if include_apartments and urls:
+        apartments = Apartments(urls, workers, session, queue, dedupe, building_cache, fingerprints)
+        apt_fmt = ListingFormatter(apartments.data(), keep_raw=False)
+        apt_fmt.select(DETAILS_APT, ADDRESS_APT, HOME_APT)
+        apt_fmt.fix_urls()
+        data.concat_df(apt_fmt.df)
+
+    """calc columns"""
+    data.price_per_sqft()
+    data.remove_dupes()
+
+    return data.df
+
+
+class ListingStats:
+    """
+    Running count/mean aggregates, built chunk by chunk to match main.stats on the full DataFrame
+    """
+
+    def __init__(self):
+        self._by_status = None
+        self._by_zipcode = None
+
+    def update(self, df: pd.DataFrame):
+        self._by_status = self._merge(self._by_status, self._partial(df, ['status'], ['listed']))
+        self._by_zipcode = self._merge(self._by_zipcode,
+                                       self._partial(df, ['zipcode', 'status'], ['listed', 'price_per_sqft']))
+
+    def by_status(self):
+        return self._result(self._by_status, ['listed'])
+
+    def by_zipcode(self):
+        return self._result(self._by_zipcode, ['listed', 'price_per_sqft'])
+
+    @staticmethod
+    def _partial(df, keys, mean_columns):
+        # count of url, sum and non-null count for each mean, so chunks can be added together
+        grouped = df.groupby(keys)
+        partial = grouped[['url']].count()
+        for column in mean_columns:
+            partial[f'{column}_sum'] = grouped[column].sum()
+            partial[f'{column}_n'] = grouped[column].count()
+        return partial
+
+    @staticmethod
+    def _merge(total, partial):
+        return partial if total is None else total.add(partial, fill_value=0)
+
+    @staticmethod
+    def _result(total, mean_columns):
+        if total is None:
+            return pd.DataFrame()
+        result = total[['url']].copy()
+        result['url'] = result['url'].astype(int)
+        for column in mean_columns:
+            result[column] = total[f'{column}_sum'] / total[f'{column}_n']
+        return result.reset_index()
+
+
+def stream_export(search: Search, listings_file: str, for_sale_file: str, for_rent_file: str,
+                  apartment_file: str = None, chunk_size: int = CHUNK_SIZE, read_cache: bool = False,
+                  include_apartments: bool = False, workers: int = 1, session=None, queue=None,
+                  dedupe: DedupeIndex = None, building_cache=None, store=None, date: str = None,
+                  market: str = None, rollup=None) -> ListingStats:
+    """
+    Fetches, formats and appends listings to the output files one chunk at a time
+    :param search: listings source, pages are consumed as they are fetched
+    :param apartment_file: optional JSON file of apartment building urls, written at the end
+    :param chunk_size: listings formatted and written together
+    :param store: optional ListingStore each chunk is also written to as the date/market run
+    :param rollup: optional Rollup updated with each chunk
+    :return: stats accumulated over every chunk
+    """
+    stats = ListingStats()
+    dedupe = dedupe if dedupe is not None else DedupeIndex()
+    apartment_urls = []
+    rows, chunks = 0, 0
+    for i, chunk in enumerate(iter_chunks(search.iter_pages(read_cache), chunk_size)):
+        df = format_chunk(chunk, apartment_urls, include_apartments, workers, session, queue, dedupe,
+                          building_cache)
+        del chunk
+        append = i > 0
+        export_csv(df, listings_file, append)
+        export_csv(df[df["status"] == "FOR_SALE"], for_sale_file, append)
+        export_csv(df[df["status"] == "FOR_RENT"], for_rent_file, append)
+        if store:
+            store.write(df, date, market, append)
+        if rollup is not None:
+            rollup.update(df)
+        stats.update(df)
+        rows, chunks = rows + len(df), i + 1
+        log.info(f"Exported chunk {i + 1}: {len(df)} listings ({rows} total)")
+    if not chunks:
+        # no listings, the files still get the formatted columns' header
+        empty = pd.DataFrame(columns=COLUMNS)
+        for file in (listings_file, for_sale_file, for_rent_file):
+            export_csv(empty, file)
+    if apartment_file:
+        write_json(apartment_urls, apartment_file)
+    return stats
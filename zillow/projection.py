@@ -0,0 +1,79 @@
+from typing import Dict, List, Union
+
+import pandas as pd
+
+"""
+Builds a DataFrame from only the dotted paths named in column mappings, instead of flattening every field
+>>> project(listings, DETAILS, ADDRESS, HOME)
+matches pd.json_normalize(listings) followed by Formatter.select_rename_columns(DETAILS, ADDRESS, HOME)
+records are raw dicts or objects with get(dotted path, default), e.g. record.ListingRecord
+"""
+
+# json_normalize fills missing fields with NaN
+MISSING = float("nan")
+
+
+def column_paths(*column_mappings: Union[Dict[str, str], List[str]]):
+    """
+    :return: list of (dotted path, column name) in output order, duplicates kept like select_rename_columns
+    """
+    rename_mapping = {}
+    keep_columns = []
+    for columns in column_mappings:
+        if type(columns) == dict:
+            rename_mapping.update(columns)
+            keep_columns.extend(list(columns.values()))
+        if type(columns) == list:
+            keep_columns.extend(columns)
+    sources = {name: path for path, name in rename_mapping.items()}
+    return [(sources.get(name, name), name) for name in keep_columns]
+
+
+def resolve(record: dict, keys: List[str]):
+    """value at a dotted path split into keys, MISSING if absent or not a leaf"""
+    if not isinstance(record, dict):
+        return record.get(".".join(keys), MISSING)
+    value = record
+    for key in keys:
+        if not isinstance(value, dict) or key not in value:
+            return MISSING
+        value = value[key]
+    return MISSING if isinstance(value, dict) else value
+
+
+def project(records: List[dict], *column_mappings: Union[Dict[str, str], List[str]]) -> pd.DataFrame:
+    """
+    Pulls the mapped paths out of each record into one array per column and builds the DataFrame once
+    :param records: raw (nested) dicts or compact records
+    :param column_mappings: {'column.path': 'rename_column'} or ['column_name', ...], see formatter.py
+    :return: DataFrame with renamed columns in mapping order
+    """
+    paths = column_paths(*column_mappings)
+    verify_renames(records, column_mappings)
+    # columns are keyed by position, mappings may repeat a column (e.g. lot_area in DETAILS and HOME_EXT)
+    data = {i: column(records, path) for i, (path, _) in enumerate(paths)}
+    df = pd.DataFrame(data, columns=range(len(paths)))
+    df.columns = [name for _, name in paths]
+    return df
+
+
+def column(records: list, path: str) -> list:
+    keys = path.split(".")
+    return [resolve(record, keys) if isinstance(record, dict) else record.get(path, MISSING) for record in records]
+
+
+def verify_renames(records: List[dict], column_mappings):
+    """same guard as select_rename_columns, renamed names have no dots so only top level leaves can collide"""
+    renames = set()
+    for columns in column_mappings:
+        if type(columns) == dict:
+            renames.update(columns.values())
+    if not renames:
+        return
+    existing = set()
+    for record in records:
+        if isinstance(record, dict):
+            existing.update(key for key in renames.intersection(record) if not isinstance(record[key], dict))
+        else:
+            existing.update(key for key in renames if record.get(key, MISSING) is not MISSING)
+    assert len(existing) == 0, f"Rename column name exists in data already: {existing}"
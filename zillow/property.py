@@ -1,8 +1,14 @@
-import json
 import logging
 import re
-from typing import List
+from itertools import islice
+from typing import Dict, List
+from .building_cache import BuildingCache, unit_fingerprint
+from .crawler import map_ordered
+from .dedupe import DedupeIndex
+from .extract import building, property_details
+from .metrics import METRICS
 from .session import Session
+from .work_queue import WorkQueue, run_queued, BUILDING, UNIT
 
 
 log = logging.getLogger(__name__)
@@ -11,51 +17,127 @@ log = logging.getLogger(__name__)
 class Apartments:
     BASE_URL = "https://www.zillow.com"
 
-    def __init__(self, urls: List[str]):
-        self.session = Session()
+    def __init__(self, urls: List[str], workers: int = 1, session: Session = None, queue: WorkQueue = None,
+                 dedupe: DedupeIndex = None, building_cache: BuildingCache = None,
+                 listing_fingerprints: Dict[str, str] = None):
+        """
+        :param urls: partial building urls from search results
+        :param workers: number of buildings/units fetched in parallel
+        :param session: optional shared Session, e.g. with a response cache
+        :param queue: optional persistent work queue, finished buildings and units are replayed instead of fetched
+        :param dedupe: optional index shared across the run, buildings and units already fetched are skipped
+        :param building_cache: optional persistent cache of building unit lists and unchanged units' details
+        :param listing_fingerprints: {partial url: fingerprint of the building's search result}, see
+            building_cache.building_fingerprints, buildings unchanged in the search results reuse their unit list longer
+        """
+        self.session = session if session else Session()
         self.partial_urls = urls
+        self.workers = workers
+        self.queue = queue
+        self.dedupe = dedupe if dedupe is not None else DedupeIndex()
+        self.building_cache = building_cache
+        self.listing_fingerprints = {f"{self.BASE_URL}{url}": fingerprint
+                                     for url, fingerprint in (listing_fingerprints or {}).items()}
 
     def data(self):
-        rental_urls = []
-        for url in self.partial_urls:
-            rental_urls.extend(self._get_rental_unit_urls(f"{self.BASE_URL}{url}"))
+        return [unit for units in self.data_by_building().values() for unit in units]
+
+    def data_by_building(self):
+        """
+        :return: {partial building url: [unit details]} in input order, failed or empty unit pages are dropped
+        """
+        partial_urls = self.dedupe.unique(BUILDING, self.partial_urls)
+        building_urls = [f"{self.BASE_URL}{url}" for url in partial_urls]
+        if self.queue:
+            self.queue.add(BUILDING, building_urls)
+        buildings = map_ordered(self._queued_building_units, building_urls, self.workers, default={})
+        fingerprints = {url: fingerprint for units in buildings if units for url, fingerprint in units.items()}
+        building_units = [self.dedupe.unique(UNIT, list(units or {})) for units in buildings]
+        rental_urls = [url for unit_urls in building_units for url in unit_urls]
         log.debug(rental_urls)
-        unit_data = []
-        for url in rental_urls:
-            # TODO: parallel process
-            # TODO: cache lot_id for dev
-            unit_data.append(Property(url, self.session).fetch())
-        return unit_data
-        
-    def _get_rental_unit_urls(self, url):
+        if self.queue:
+            self.queue.add(UNIT, rental_urls)
+        units = iter(map_ordered(lambda url: run_queued(self.queue, UNIT, url, self._unit, url, fingerprints[url]),
+                                 rental_urls, self.workers))
+        log.info(f"Skipped fetches already done in this run: {self.dedupe.skipped}")
+        if self.building_cache:
+            log.info(f"Building cache: {self.building_cache.stats()}")
+        by_building = {url: [unit for unit in islice(units, len(unit_urls)) if unit]
+                       for url, unit_urls in zip(partial_urls, building_units)}
+        METRICS.inc("rows_total", len(building_urls), stage="buildings")
+        METRICS.inc("rows_total", sum(len(units) for units in by_building.values()), stage="units")
+        return by_building
+
+    def _queued_building_units(self, url):
+        return queued_units(run_queued(self.queue, BUILDING, url, self._building_units, url))
+
+    def _building_units(self, url):
+        """
+        :return: {unit url: fingerprint}, from the building cache while fresh, otherwise from the building page
+            None when the building page has no units, so a work queue retries it
+        """
+        listing = self.listing_fingerprints.get(url)
+        if self.building_cache:
+            units = self.building_cache.building(url, listing)
+            if units is not None:
+                return units
+        building, units = self._get_rental_units(url)
+        if not units:
+            return None
+        if self.building_cache:
+            self.building_cache.put_building(url, building.get("zpid"), units, listing)
+        return units
+
+    def _unit(self, url, fingerprint):
+        """property details, reused from the building cache when the unit's floor plan entry is unchanged"""
+        if self.building_cache and fingerprint:
+            details = self.building_cache.unit(url, fingerprint)
+            if details is not None:
+                return details
+        details = Property(url, self.session).fetch()
+        if self.building_cache and fingerprint and details:
+            self.building_cache.put_unit(url, fingerprint, details)
+        return details
+
+    def _get_rental_units(self, url):
+        """
+        :return: building details and {unit url: fingerprint of its floor plan entry} in floor plan order
+        """
         building = self._scrape_rental_results(url)
         address = building.get("address")
         floor_plans = building.get("floorPlans")
         if not floor_plans:
-            # TODO: debug why
             log.error(f"Failed to find units for {url}")
-            return []
+            return building, {}
         fallback = building.get("bestMatchedUnit").get("hdpUrl")
-        unit_urls = []
+        units = {}
         for plan in floor_plans:
             if "units" not in plan or not plan.get("units"):
                 log.debug(f"No units found: {plan}")
-                unit_urls.append(f"{self.BASE_URL}{fallback.replace(building.get('zpid'), plan.get('zpid'))}")
+                units[f"{self.BASE_URL}{fallback.replace(building.get('zpid'), plan.get('zpid'))}"] = \
+                    unit_fingerprint(plan)
                 continue
             for unit in plan.get("units"):
                 unit_num = '-'.join(re.findall(r'[0-9]+', str(unit.get('unitNumber'))))
-                unit_urls.append(f"{self.BASE_URL}/homedetails/{address.get('streetAddress').replace(' ', '-')}"
-                                 f"-{unit_num}-{address.get('city')}-{address.get('state')}-{address.get('zipcode')}/"
-                                 f"{unit.get('zpid')}_zpid/")
-        return unit_urls
+                units[f"{self.BASE_URL}/homedetails/{address.get('streetAddress').replace(' ', '-')}"
+                      f"-{unit_num}-{address.get('city')}-{address.get('state')}-{address.get('zipcode')}/"
+                      f"{unit.get('zpid')}_zpid/"] = unit_fingerprint(unit)
+        return building, units
 
     def _scrape_rental_results(self, url):
-        page = self.session.get(url).text
-        search = re.search(r'(\{"props":.*?)</script>', page)
-        if not search:
-            return None
-        data = json.loads(search.group(1))
-        return data.get("props").get("initialData").get("building")
+        with METRICS.timer("stage_seconds", stage="building"):
+            data = building(self.session.get(url).content)
+        if data is None:
+            self.session.invalidate(url)
+        return data
+
+
+def queued_units(units):
+    """
+    building job result as {unit url: fingerprint}, queues written before unit fingerprints stored a list of unit
+    urls, those units have no fingerprint and skip the building cache
+    """
+    return dict.fromkeys(units) if isinstance(units, list) else units
 
 
 class Property:
@@ -65,12 +147,9 @@ class Property:
         self.url = url
 
     def fetch(self):
-        page = self.session.get(self.url).text
-        search = re.search(r'(\{"apiCache".*?)</script>', page)
-        if not search:
-            return {}
-        raw = json.loads(search.group(1))
-        cache = json.loads(raw.get('apiCache'))
-        if len(cache.keys()) >= 2:
-            return cache.get(list(cache.keys())[1]).get('property')
+        with METRICS.timer("stage_seconds", stage="unit"):
+            details = property_details(self.session.get(self.url).content)
+        if details is None:
+            self.session.invalidate(self.url)
+        return details
 
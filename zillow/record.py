@@ -0,0 +1,90 @@
+from typing import List, Tuple
+
+from .building_cache import BUILDING_FIELDS
+from .formatter import DETAILS, ADDRESS, HOME, HOME_EXT, ADDRESS_EXT, ZESTIMATE, PRICE_CHANGE
+from .projection import column_paths, resolve, MISSING
+
+"""
+Compact search listings kept between scraping and formatting instead of the full nested dicts zillow returns
+>>> record = ListingRecord.from_listing(listing)
+>>> record.get("hdpData.homeInfo.homeType")
+>>> ListingFormatter([record, ...]).select(DETAILS, ADDRESS, HOME)
+"""
+
+# dotted paths kept from a search listing: zpid, every search column mapping and the building cache fields
+FIELDS: Tuple[str, ...] = tuple(dict.fromkeys(
+    ["zpid", *(path for path, _ in column_paths(DETAILS, ADDRESS, HOME, HOME_EXT, ADDRESS_EXT, ZESTIMATE,
+                                                  PRICE_CHANGE)), *BUILDING_FIELDS]))
+FIELD_INDEX = {path: i for i, path in enumerate(FIELDS)}
+FIELD_KEYS = [path.split(".") for path in FIELDS]
+
+
+class _Absent:
+    """marks a field missing from the listing, unlike None for a null value"""
+
+    def __repr__(self):
+        return "ABSENT"
+
+    def __reduce__(self):
+        # records are pickled to format workers, the marker stays a singleton
+        return "ABSENT"
+
+
+ABSENT = _Absent()
+
+
+class ListingRecord:
+    """
+    FIELDS values of one search listing, the raw listing is only referenced when kept for raw output
+    """
+    __slots__ = ("values", "raw")
+
+    def __init__(self, values: tuple, raw: dict = None):
+        self.values = values
+        self.raw = raw
+
+    @classmethod
+    def from_listing(cls, listing: dict, keep_raw: bool = False) -> "ListingRecord":
+        values = tuple(ABSENT if value is MISSING else value
+                       for value in (resolve(listing, keys) for keys in FIELD_KEYS))
+        return cls(values, listing if keep_raw else None)
+
+    def get(self, path: str, default=None):
+        """
+        :param path: dotted path, e.g. "hdpData.homeInfo.homeType", paths outside FIELDS need the raw listing
+        :return: value at path or default if absent
+        """
+        index = FIELD_INDEX.get(path)
+        if index is not None:
+            value = self.values[index]
+        elif self.raw is not None:
+            value = resolve(self.raw, path.split("."))
+        else:
+            value = ABSENT
+        return default if value is ABSENT or value is MISSING else value
+
+    def to_dict(self) -> dict:
+        """raw listing when kept, otherwise a nested dict of the FIELDS present"""
+        if self.raw is not None:
+            return self.raw
+        listing = {}
+        for keys, value in zip(FIELD_KEYS, self.values):
+            if value is ABSENT:
+                continue
+            parent = listing
+            for key in keys[:-1]:
+                parent = parent.setdefault(key, {})
+            parent[keys[-1]] = value
+        return listing
+
+    def __repr__(self):
+        return f"ListingRecord({self.get('zpid')!r}, {self.get('detailUrl')!r})"
+
+
+def to_records(listings: List[dict], keep_raw: bool = False) -> List[ListingRecord]:
+    return [ListingRecord.from_listing(listing, keep_raw) for listing in listings]
+
+
+def to_dict(listing) -> dict:
+    """raw dict of a listing or record, e.g. for JSON output"""
+    return listing if isinstance(listing, dict) else listing.to_dict()
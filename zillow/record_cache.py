@@ -0,0 +1,203 @@
+import json
+import logging
+import os
+import struct
+import time
+import zlib
+from pathlib import Path
+from typing import Iterable, List, Optional
+
+from .dedupe import listing_key
+from .extract import loads
+from .file_util import mkdir, file_exists
+
+log = logging.getLogger(__name__)
+
+"""
+Raw listing cache: one zlib compressed JSON blob per listing in a .rec file, followed by an index of
+key -> (status, offset, length) and the fetch time, so lookups and status reads only decode what they return
+>>> write_records(listings, "./data/zillow/zipcode/43085.rec")
+>>> writer = RecordWriter("./data/zillow/zipcode/43085.rec")
+>>> writer.extend(page)  # once per page, then writer.close() or writer.abort()
+>>> read_records("./data/zillow/zipcode/43085.rec", status="FOR_RENT")
+>>> iter_record_batches("./data/zillow/zipcode/43085.rec", 500)
+>>> lookup_record("./data/zillow/zipcode/43085.rec", "12345")
+>>> record_age("./data/zillow/zipcode/43085.rec")
+>>> is_compact("./data/zillow/zipcode/43085.rec")
+a legacy JSON array cache next to the record file (43085.json) is migrated on first access
+"""
+
+RECORD_SUFFIX: str = ".rec"
+FORMAT_VERSION: int = 2  # 1 kept the index in a sidecar .idx file
+COMPRESSION_LEVEL: int = 6
+# last bytes of a record file: magic and offset of the JSON index, records and index are replaced in one rename
+TRAILER = struct.Struct("<4sQ")
+MAGIC: bytes = b"ZREC"
+
+
+def is_record_file(file: str):
+    return Path(file).suffix == RECORD_SUFFIX
+
+
+def legacy_file(file: str) -> str:
+    return str(Path(file).with_suffix(".json"))
+
+
+def record_file(file: str) -> str:
+    """record file replacing a legacy .json cache path, other paths unchanged"""
+    return str(Path(file).with_suffix(RECORD_SUFFIX)) if Path(file).suffix == ".json" else file
+
+
+def write_records(listings: Iterable[dict], file: str, fetched: float = None):
+    """
+    Writes listings as compressed records followed by their index, replacing the file atomically
+    :param listings: raw dicts or compact records, see record.ListingRecord
+    :param fetched: fetch timestamp stored in the index, defaults to now
+    """
+    if not file:
+        return
+    writer = RecordWriter(file, fetched)
+    try:
+        writer.extend(listings)
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
+
+
+class RecordWriter:
+    """
+    Appends listings to a record file as they are fetched, so they are not all held for write_records
+    close() writes the index and replaces the file atomically, abort() keeps the previous file
+    """
+
+    def __init__(self, file: str, fetched: float = None):
+        """
+        :param fetched: fetch timestamp stored in the index, defaults to when writing starts
+        """
+        mkdir(file)
+        self.file = file
+        self.fetched = time.time() if fetched is None else fetched
+        self.entries = []
+        self.offset = 0
+        self.compact = False
+        self._f = open(f"{file}.tmp", 'wb')
+
+    def extend(self, listings: Iterable[dict]):
+        for listing in listings:
+            # a record without its raw listing only stores the record fields
+            self.compact |= not isinstance(listing, dict) and listing.raw is None
+            payload = listing if isinstance(listing, dict) else listing.to_dict()
+            blob = zlib.compress(json.dumps(payload, separators=(',', ':')).encode(), COMPRESSION_LEVEL)
+            self._f.write(blob)
+            self.entries.append([_key(listing), listing.get("statusType"), self.offset, len(blob)])
+            self.offset += len(blob)
+
+    def close(self):
+        index = {"version": FORMAT_VERSION, "fetched": self.fetched, "compact": self.compact,
+                 "count": len(self.entries), "records": self.entries}
+        with self._f:
+            self._f.write(json.dumps(index, separators=(',', ':')).encode())
+            self._f.write(TRAILER.pack(MAGIC, self.offset))
+        os.replace(f"{self.file}.tmp", self.file)
+
+    def abort(self):
+        self._f.close()
+        os.remove(f"{self.file}.tmp")
+
+
+def read_index(file: str) -> Optional[dict]:
+    """
+    :return: {"version", "fetched", "compact", "count", "records": [[key, status, offset, length], ...]} or None if
+        missing, truncated or written by an older format version, which callers treat as a cache miss
+    """
+    migrate_json(file)
+    if not file_exists(file):
+        return None
+    with open(file, 'rb') as f:
+        size = f.seek(0, os.SEEK_END)
+        if size < TRAILER.size:
+            return None
+        f.seek(size - TRAILER.size)
+        magic, offset = TRAILER.unpack(f.read(TRAILER.size))
+        if magic != MAGIC or offset > size - TRAILER.size:
+            log.warning(f"Ignoring record file without a valid index: {file}")
+            return None
+        f.seek(offset)
+        index = json.loads(f.read(size - TRAILER.size - offset))
+    return index if index.get("version") == FORMAT_VERSION else None
+
+
+def read_records(file: str, status: str = None, keys: Iterable = None) -> List[dict]:
+    """
+    Decodes only the records matching status and keys, in stored order
+    :param status: e.g. FOR_RENT, None for every status
+    :param keys: zpids (or building detail urls), None for every record
+    """
+    index = read_index(file)
+    if index is None:
+        return []
+    keys = None if keys is None else {str(key) for key in keys}
+    entries = [entry for entry in index["records"]
+               if (status is None or entry[1] == status) and (keys is None or entry[0] in keys)]
+    records = []
+    with open(file, 'rb') as f:
+        if len(entries) == index["count"]:
+            data = f.read()
+            return [loads(zlib.decompress(data[offset:offset + length])) for _, _, offset, length in entries]
+        for _, _, offset, length in entries:
+            f.seek(offset)
+            records.append(loads(zlib.decompress(f.read(length))))
+    return records
+
+
+def iter_record_batches(file: str, size: int):
+    """
+    Decodes every record in stored order, size at a time, so a large cache is not held at once
+    :return: generator of record lists
+    """
+    index = read_index(file)
+    if index is None:
+        return
+    entries = index["records"]
+    with open(file, 'rb') as f:
+        for start in range(0, len(entries), size):
+            batch = []
+            for _, _, offset, length in entries[start:start + size]:
+                f.seek(offset)
+                batch.append(loads(zlib.decompress(f.read(length))))
+            yield batch
+
+
+def lookup_record(file: str, key) -> Optional[dict]:
+    records = read_records(file, keys=[key])
+    return records[0] if records else None
+
+
+def record_age(file: str) -> Optional[float]:
+    """seconds since the records were fetched, None when there is no cache"""
+    index = read_index(file)
+    return time.time() - index["fetched"] if index else None
+
+
+def is_compact(file: str) -> bool:
+    """whether the cache holds only the record fields instead of the raw listings"""
+    index = read_index(file)
+    return bool(index and index.get("compact"))
+
+
+def migrate_json(file: str):
+    """converts a legacy JSON array cache to records, keeping its modification time as the fetch time"""
+    legacy = legacy_file(file)
+    if file_exists(file) or not file_exists(legacy):
+        return
+    with open(legacy, 'rb') as f:
+        listings = loads(f.read())
+    write_records(listings, file, fetched=os.path.getmtime(legacy))
+    os.remove(legacy)
+    log.info(f"Migrated {len(listings)} cached listings: {legacy} -> {file}")
+
+
+def _key(listing: dict) -> Optional[str]:
+    key = listing_key(listing)
+    return None if key is None else str(key)
@@ -0,0 +1,217 @@
+import json
+import logging
+import math
+import sqlite3
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from .file_util import mkdir
+
+log = logging.getLogger(__name__)
+
+"""
+Per zipcode/status aggregates kept as a time series, so trends never rescan raw listings
+>>> rollup = Rollup()
+>>> rollup.update(df)  # once per run, or once per chunk
+>>> RollupStore("./data/rollups.db").save("20230101", "columbus", rollup)
+>>> RollupStore("./data/rollups.db").series("columbus", zipcode="43085", status="FOR_RENT")
+"""
+
+ROLLUP_FILE: str = "./data/rollups.db"
+# relative accuracy of sketch quantiles, a median is within 1% of a value in the data
+SKETCH_ALPHA: float = 0.01
+QUANTILES = {"p10": 0.1, "median": 0.5, "p90": 0.9}
+
+
+class QuantileSketch:
+    """
+    Log bucketed histogram: value v > 0 falls in bucket ceil(log(v) / log(gamma)), gamma = (1 + a) / (1 - a)
+    quantiles are within relative accuracy a, sketches with the same a merge by adding bucket counts
+    """
+
+    def __init__(self, alpha: float = SKETCH_ALPHA, bins: Dict[int, int] = None, zero: int = 0):
+        self.alpha = alpha
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self.bins = Counter(bins or {})
+        self.zero = zero  # values <= 0
+
+    @property
+    def count(self) -> int:
+        return self.zero + sum(self.bins.values())
+
+    def add(self, values: Iterable[float]):
+        """adds numeric values, NaN and infinities are ignored"""
+        values = finite(values)
+        positive = values[values > 0]
+        self.zero += len(values) - len(positive)
+        keys, counts = np.unique(np.ceil(np.log(positive) / math.log(self.gamma)).astype(int), return_counts=True)
+        self.bins.update(dict(zip(keys.tolist(), counts.tolist())))
+
+    def merge(self, other: "QuantileSketch"):
+        if other.alpha != self.alpha:
+            raise ValueError("sketches with different accuracy cannot be merged")
+        self.bins.update(other.bins)
+        self.zero += other.zero
+        return self
+
+    def quantile(self, q: float):
+        """
+        :return: approximate q-th quantile, None for an empty sketch
+        """
+        count = self.count
+        if not count:
+            return None
+        rank = q * (count - 1)
+        if rank < self.zero:
+            return 0.0
+        seen = self.zero
+        for key in sorted(self.bins):
+            seen += self.bins[key]
+            if seen > rank:
+                # bucket midpoint in the relative sense, within alpha of every value in the bucket
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.bins) / (self.gamma + 1)
+
+    def to_json(self) -> str:
+        return json.dumps({"a": self.alpha, "z": self.zero, "b": {str(k): v for k, v in self.bins.items()}},
+                          separators=(',', ':'))
+
+    @classmethod
+    def from_json(cls, text: str) -> "QuantileSketch":
+        data = json.loads(text)
+        return cls(data["a"], {int(k): v for k, v in data["b"].items()}, data["z"])
+
+
+def finite(values: Iterable[float]) -> np.ndarray:
+    values = np.asarray(values, dtype=float)
+    return values[np.isfinite(values)]
+
+
+class Aggregate:
+    """count, sums and sketches of listed price and price_per_sqft for one zipcode/status"""
+
+    def __init__(self, count: int = 0, listed_sum: float = 0.0, listed_n: int = 0, ppsf_sum: float = 0.0,
+                 ppsf_n: int = 0, listed_sketch: QuantileSketch = None, ppsf_sketch: QuantileSketch = None):
+        self.count = count
+        self.listed_sum = listed_sum
+        self.listed_n = listed_n
+        self.ppsf_sum = ppsf_sum
+        self.ppsf_n = ppsf_n
+        self.listed_sketch = listed_sketch or QuantileSketch()
+        self.ppsf_sketch = ppsf_sketch or QuantileSketch()
+
+    def add(self, listed: pd.Series, ppsf: pd.Series, count: int):
+        # price_per_sqft is infinite for listings with a zero area
+        listed, ppsf = finite(listed), finite(ppsf)
+        self.count += count
+        self.listed_sum += float(listed.sum())
+        self.listed_n += len(listed)
+        self.ppsf_sum += float(ppsf.sum())
+        self.ppsf_n += len(ppsf)
+        self.listed_sketch.add(listed)
+        self.ppsf_sketch.add(ppsf)
+
+    def merge(self, other: "Aggregate"):
+        self.count += other.count
+        self.listed_sum += other.listed_sum
+        self.listed_n += other.listed_n
+        self.ppsf_sum += other.ppsf_sum
+        self.ppsf_n += other.ppsf_n
+        self.listed_sketch.merge(other.listed_sketch)
+        self.ppsf_sketch.merge(other.ppsf_sketch)
+        return self
+
+    def summary(self) -> dict:
+        summary = {"count": self.count,
+                   "listed_mean": self.listed_sum / self.listed_n if self.listed_n else None,
+                   "price_per_sqft_mean": self.ppsf_sum / self.ppsf_n if self.ppsf_n else None}
+        for name, q in QUANTILES.items():
+            summary[f"listed_{name}"] = self.listed_sketch.quantile(q)
+        summary["price_per_sqft_median"] = self.ppsf_sketch.quantile(0.5)
+        return summary
+
+
+class Rollup:
+    """
+    {(zipcode, status): Aggregate} updated from formatted listings, rows missing zipcode or status are skipped
+    like main.stats groupbys
+    """
+
+    def __init__(self):
+        self.aggregates: Dict[Tuple[str, str], Aggregate] = {}
+
+    def update(self, df: pd.DataFrame):
+        df = df[df["zipcode"].notna() & df["status"].notna()]
+        for (zipcode, status), group in df.groupby([df["zipcode"].astype(str), "status"], sort=False):
+            aggregate = self.aggregates.setdefault((zipcode, status), Aggregate())
+            aggregate.add(pd.to_numeric(group["listed"], errors="coerce"),
+                          pd.to_numeric(group["price_per_sqft"], errors="coerce"), len(group))
+
+    def summary(self) -> pd.DataFrame:
+        return pd.DataFrame([{"zipcode": zipcode, "status": status, **aggregate.summary()}
+                             for (zipcode, status), aggregate in sorted(self.aggregates.items())])
+
+
+class RollupStore:
+    """
+    Rollups of every run, one row per date/market/zipcode/status, safe to share between threads
+    """
+
+    def __init__(self, db_file: str = ROLLUP_FILE):
+        mkdir(db_file)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_file, check_same_thread=False, isolation_level=None)
+        self._db.execute("CREATE TABLE IF NOT EXISTS rollups (date TEXT, market TEXT, zipcode TEXT, status TEXT, "
+                         "count INTEGER, listed_sum REAL, listed_n INTEGER, ppsf_sum REAL, ppsf_n INTEGER, "
+                         "listed_sketch TEXT, ppsf_sketch TEXT, PRIMARY KEY (market, date, zipcode, status))")
+
+    def save(self, date: str, market: str, rollup: Rollup):
+        """replaces the market's rollup for date"""
+        rows = [(date, market, zipcode, status, a.count, a.listed_sum, a.listed_n, a.ppsf_sum, a.ppsf_n,
+                 a.listed_sketch.to_json(), a.ppsf_sketch.to_json())
+                for (zipcode, status), a in rollup.aggregates.items()]
+        with self._lock:
+            self._db.execute("BEGIN")
+            self._db.execute("DELETE FROM rollups WHERE market = ? AND date = ?", (market, date))
+            self._db.executemany("INSERT INTO rollups VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            self._db.execute("COMMIT")
+        log.info(f"Saved rollup of {len(rows)} zipcode/status groups for {market} {date}")
+
+    def series(self, market: str, zipcode: str = None, status: str = None, start: str = None, end: str = None,
+               by_zipcode: bool = True) -> pd.DataFrame:
+        """
+        Trend of a market, one row per date (and zipcode) and status
+        :param by_zipcode: False merges the zipcodes of each date into market wide aggregates
+        :param start: first date, inclusive
+        :param end: last date, inclusive
+        """
+        clauses, params = ["market = ?"], [market]
+        for clause, value in (("zipcode = ?", zipcode), ("status = ?", status), ("date >= ?", start),
+                              ("date <= ?", end)):
+            if value is not None:
+                clauses.append(clause)
+                params.append(str(value))
+        with self._lock:
+            rows = self._db.execute(f"SELECT date, zipcode, status, count, listed_sum, listed_n, ppsf_sum, ppsf_n, "
+                                    f"listed_sketch, ppsf_sketch FROM rollups WHERE {' AND '.join(clauses)} "
+                                    f"ORDER BY date, zipcode, status", params).fetchall()
+        merged: Dict[tuple, Aggregate] = {}
+        for date, row_zipcode, row_status, *values in rows:
+            aggregate = Aggregate(*values[:5], QuantileSketch.from_json(values[5]), QuantileSketch.from_json(values[6]))
+            key = (date, row_zipcode, row_status) if by_zipcode else (date, row_status)
+            if key in merged:
+                merged[key].merge(aggregate)
+            else:
+                merged[key] = aggregate
+        columns = ["date", "zipcode", "status"] if by_zipcode else ["date", "status"]
+        return pd.DataFrame([{**dict(zip(columns, key)), **aggregate.summary()} for key, aggregate in merged.items()])
+
+    def dates(self, market: str) -> List[str]:
+        with self._lock:
+            rows = self._db.execute("SELECT DISTINCT date FROM rollups WHERE market = ? ORDER BY date",
+                                    (market,)).fetchall()
+        return [row[0] for row in rows]
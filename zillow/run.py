@@ -1,4 +1,5 @@
 import logging
+from .building_cache import building_fingerprints
 from .file_util import export_csv, write_json
 from .listings import Search
 from .formatter import *
@@ -8,8 +9,12 @@ FOR_SALE_LISTINGS_FILE = "for-sale.csv"
 FOR_RENT_LISTINGS_FILE = "for-rent.csv"
 
 
-def format_data(listings, apartment_file=None, include_apartments=False):
-    """transform and format listing data"""
+def format_data(listings, apartment_file=None, include_apartments=False, workers=1, session=None, queue=None,
+                dedupe=None, building_cache=None):
+    """
+    transform and format listing data
+    :param building_cache: optional BuildingCache, unchanged buildings and units are not fetched again
+    """
 
     data = ListingFormatter(listings)
     data.select(DETAILS, ADDRESS, HOME)
@@ -24,7 +29,9 @@ def format_data(listings, apartment_file=None, include_apartments=False):
     if include_apartments:
         logging.info(f"Fetching more data for {len(apartment_urls)} apartments")
         # formatting is fragmented, updates to `data` (listings df) must be applied to apartments df
-        apt_data = Apartments(apartment_urls).data()
+        # buildings unchanged in the search results reuse their cached unit lists
+        fingerprints = building_fingerprints(listings) if building_cache else None
+        apt_data = Apartments(apartment_urls, workers, session, queue, dedupe, building_cache, fingerprints).data()
         apt_fmt = ListingFormatter(apt_data)
         apt_fmt.select(DETAILS_APT, ADDRESS_APT, HOME_APT)
         apt_fmt.fix_urls()
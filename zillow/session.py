@@ -1,4 +1,36 @@
+import logging
+import threading
+import time
+
 import requests
+from requests.adapters import HTTPAdapter
+
+from .cache import ResponseCache
+from .metrics import METRICS, page_type
+from .throttle import TokenBucket, AdaptiveLimiter, backoff_delay
+
+log = logging.getLogger(__name__)
+
+# request scheduling defaults
+RATE: float = None  # requests per second, e.g. 5.0, None disables the token bucket
+BURST: int = 10
+INITIAL_CONCURRENCY: int = 4
+MAX_CONCURRENCY: int = 16
+RETRIES: int = 3
+BACKOFF_BASE: float = 1.0
+BACKOFF_CAP: float = 60.0
+TIMEOUT: tuple = (5, 30)  # connect, read seconds
+POOL_SIZE: int = 16
+
+# responses that mean zillow is throttling us
+BLOCK_STATUS = {403, 429}
+RETRY_STATUS = {500, 502, 503, 504}
+BLOCK_MARKERS = (b"px-captcha", b"captchaPerimeterX")
+CAPTCHA_PAGE_SIZE: int = 100 * 1024  # only pages smaller than this are checked for markers
+
+
+class RequestFailed(requests.RequestException):
+    """every attempt was blocked or failed with a 5xx, the session already retried with backoff"""
 
 
 # Request session wrapper
@@ -11,8 +43,116 @@ class Session:
         'user-agent': 'Mozilla/5.0 (Linux; Android 4.4.4; Nexus 5 Build/KTU84P) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/66.0.3359.126 Mobile Safari/537.36'
     }
 
-    def __init__(self):
+    def __init__(self, cache: ResponseCache = None, rate: float = RATE, burst: int = BURST,
+                 initial_concurrency: int = INITIAL_CONCURRENCY, max_concurrency: int = MAX_CONCURRENCY,
+                 retries: int = RETRIES, timeout: tuple = TIMEOUT, pool_size: int = POOL_SIZE):
+        """
+        :param cache: optional response cache checked before each request
+        :param rate: average requests per second across threads, None for no limit (opt in, e.g. 5.0)
+        :param burst: requests allowed at once above the average rate
+        :param initial_concurrency: requests in flight at start, adapts between 1 and max_concurrency
+        :param max_concurrency: ceiling for requests in flight
+        :param retries: retries of blocked, failed or 5xx requests with jittered exponential backoff, callers should
+            not retry a RequestException again
+        :param timeout: requests timeout, (connect, read) seconds
+        :param pool_size: connections kept open per host
+        """
         self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.cache = cache
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self.limiter = AdaptiveLimiter(min(initial_concurrency, max_concurrency), 1, max_concurrency)
+        self.retries = retries
+        self.timeout = timeout
+        self.stats = {"requests": 0, "retries": 0, "blocks": 0, "errors": 0}
+        self._stats_lock = threading.Lock()
 
     def get(self, url):
-        return self.session.get(url, headers=self.headers)
+        if self.cache:
+            body = self.cache.get(url)
+            if body is not None:
+                METRICS.inc("cache_requests_total", page=page_type(url), result="hit")
+                return self._cached_response(url, body)
+            METRICS.inc("cache_requests_total", page=page_type(url), result="miss")
+        response = self._request(url)
+        if self.cache and response.status_code == 200 and not self.is_blocked(response):
+            self.cache.put(url, response.content)
+        return response
+
+    def invalidate(self, url):
+        """drops a cached response, e.g. a page that turned out to be a captcha"""
+        if self.cache:
+            self.cache.delete(url)
+
+    def _request(self, url):
+        """
+        Sends a GET once the rate limit and concurrency window allow, retrying blocks, errors and 5xx
+        :return: the first good response
+        :raises RequestException: the last error, or RequestFailed if every attempt was blocked or a 5xx
+        """
+        page = page_type(url)
+        for attempt in range(self.retries + 1):
+            if attempt:
+                self._count("retries")
+                METRICS.inc("retries_total", page=page)
+            if self.bucket:
+                self.bucket.acquire()
+            response, error = None, None
+            with self.limiter.slot():
+                self._count("requests")
+                try:
+                    with METRICS.timer("request_seconds", page=page):
+                        response = self.session.get(url, headers=self.headers, timeout=self.timeout)
+                except requests.RequestException as e:
+                    error = e
+            if response is not None:
+                METRICS.inc("requests_total", page=page, status=response.status_code)
+                METRICS.inc("response_bytes_total", len(response.content), page=page)
+            if response is not None and response.status_code not in RETRY_STATUS and not self.is_blocked(response):
+                self.limiter.on_success()
+                return response
+
+            if error is not None:
+                self._count("errors")
+                METRICS.inc("request_errors_total", page=page)
+                log.warning(f"Request failed: {url} ({error})")
+            elif self.is_blocked(response):
+                self._count("blocks")
+                METRICS.inc("blocks_total", page=page)
+                self.limiter.on_block()
+                log.warning(f"Blocked by zillow ({response.status_code}), concurrency {self.limiter.limit}: {url}")
+            if attempt < self.retries:
+                time.sleep(self._retry_delay(attempt, response))
+        if response is None:
+            raise error
+        raise RequestFailed(f"{response.status_code} after {self.retries + 1} attempts: {url}", response=response)
+
+    def _count(self, stat: str):
+        # crawler threads share the session
+        with self._stats_lock:
+            self.stats[stat] += 1
+
+    @staticmethod
+    def is_blocked(response):
+        if response.status_code in BLOCK_STATUS or "captchaPerimeterX" in response.url:
+            return True
+        content = response.content
+        return len(content) < CAPTCHA_PAGE_SIZE and any(marker in content for marker in BLOCK_MARKERS)
+
+    @staticmethod
+    def _retry_delay(attempt, response):
+        retry_after = response.headers.get('retry-after') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            return min(BACKOFF_CAP, float(retry_after))
+        return backoff_delay(attempt, BACKOFF_BASE, BACKOFF_CAP)
+
+    @staticmethod
+    def _cached_response(url, body):
+        response = requests.Response()
+        response.status_code = 200
+        response.url = url
+        response.encoding = 'utf-8'
+        response._content = body
+        return response
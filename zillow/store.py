@@ -0,0 +1,130 @@
+import logging
+import sqlite3
+import threading
+from typing import List, Optional
+
+import pandas as pd
+
+from .delta import zpid_from_url
+from .file_util import mkdir
+
+log = logging.getLogger(__name__)
+
+"""
+Formatted listings of every run in one indexed SQLite file, queried instead of scanning DataFrames or CSVs
+>>> store = ListingStore("./data/listings.db")
+>>> store.write(df, "20230101", "columbus")
+>>> store.query(status="FOR_RENT", zipcode="43085", max_price=2000)
+>>> store.stats_by_zipcode(date="20230101", market="columbus")
+>>> store.price_history("12345")
+"""
+
+STORE_FILE: str = "./data/listings.db"
+# formatted listing columns, see run.format_data
+COLUMNS = ["status", "url", "home_type", "listed", "lot_area", "lot_area_unit", "street", "state", "city", "zipcode",
+           "beds", "baths", "area", "price_per_sqft"]
+# every column of the listings table, the only names query accepts in columns
+TABLE_COLUMNS = ["date", "market", "zpid", *COLUMNS]
+COLUMN_TYPES = {"listed": "REAL", "lot_area": "REAL", "beds": "REAL", "baths": "REAL", "area": "REAL",
+                "price_per_sqft": "REAL"}
+INDEXES = {"zpid": ["zpid"], "zipcode": ["zipcode", "status"], "status": ["status", "home_type"],
+           "home_type": ["home_type"], "price": ["listed"], "run": ["date", "market"]}
+
+
+class ListingStore:
+    """
+    One row per (date, market, url), market is the searched city and date the run date
+    safe to share between threads
+    """
+
+    def __init__(self, db_file: str = STORE_FILE):
+        mkdir(db_file)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_file, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        columns = ", ".join(f"{column} {COLUMN_TYPES.get(column, 'TEXT')}" for column in COLUMNS)
+        self._db.execute(f"CREATE TABLE IF NOT EXISTS listings (date TEXT, market TEXT, zpid TEXT, {columns}, "
+                         f"PRIMARY KEY (date, market, url))")
+        for name, columns in INDEXES.items():
+            self._db.execute(f"CREATE INDEX IF NOT EXISTS listings_{name} ON listings ({', '.join(columns)})")
+
+    def write(self, df: pd.DataFrame, date: str, market: str, append: bool = False):
+        """
+        Stores formatted listings of a run, rows without a url are skipped
+        :param append: add to the run's rows, otherwise rows already stored for date/market are replaced
+        """
+        rows = df.reindex(columns=COLUMNS)
+        rows = rows[rows["url"].notna()].astype(object).where(rows.notna(), None)
+        zpids = rows["url"].map(zpid_from_url)
+        values = [(date, market, zpid, *row) for zpid, row in zip(zpids, rows.itertuples(index=False, name=None))]
+        placeholders = ", ".join("?" * (len(COLUMNS) + 3))
+        with self._lock:
+            self._db.execute("BEGIN")
+            if not append:
+                self._db.execute("DELETE FROM listings WHERE date = ? AND market = ?", (date, market))
+            self._db.executemany(f"INSERT OR REPLACE INTO listings VALUES ({placeholders})", values)
+            self._db.execute("COMMIT")
+        log.info(f"Stored {len(values)} listings for {market} {date}")
+
+    def query(self, date: str = None, market: str = None, status: str = None, home_type: str = None,
+              zipcode=None, zpid=None, min_price: float = None, max_price: float = None,
+              columns: List[str] = None, limit: int = None) -> pd.DataFrame:
+        """
+        Listings matching every given filter, the filters are served by the indexes
+        :param date: run date, e.g. "20230101", defaults to every run
+        :param columns: columns to return, any of TABLE_COLUMNS, defaults to all of them
+        """
+        unknown = [column for column in columns or [] if column not in TABLE_COLUMNS]
+        if unknown:
+            raise ValueError(f"Unknown listing columns {unknown}, expected any of {TABLE_COLUMNS}")
+        where, params = self._where(date=date, market=market, status=status, home_type=home_type,
+                                    zipcode=zipcode, zpid=zpid, min_price=min_price, max_price=max_price)
+        select = ", ".join(columns) if columns else "*"
+        sql = f"SELECT {select} FROM listings{where}" + (f" LIMIT {int(limit)}" if limit else "")
+        return self._read(sql, params)
+
+    def stats_by_status(self, date: str = None, market: str = None) -> pd.DataFrame:
+        """same columns as main.stats by_status: status, url (count), listed (mean)"""
+        where, params = self._where(date=date, market=market, not_null=["status"])
+        return self._read(f"SELECT status, COUNT(url) AS url, AVG(listed) AS listed FROM listings{where} "
+                          f"GROUP BY status ORDER BY status", params)
+
+    def stats_by_zipcode(self, date: str = None, market: str = None) -> pd.DataFrame:
+        """same columns as main.stats by_zipcode: zipcode, status, url (count), listed and price_per_sqft (mean)"""
+        where, params = self._where(date=date, market=market, not_null=["zipcode", "status"])
+        return self._read(f"SELECT zipcode, status, COUNT(url) AS url, AVG(listed) AS listed, "
+                          f"AVG(price_per_sqft) AS price_per_sqft FROM listings{where} "
+                          f"GROUP BY zipcode, status ORDER BY zipcode, status", params)
+
+    def price_history(self, zpid) -> pd.DataFrame:
+        """status and listed price of one zpid in every stored run"""
+        return self._read("SELECT date, market, status, listed FROM listings WHERE zpid = ? ORDER BY date",
+                          [str(zpid)])
+
+    def runs(self) -> pd.DataFrame:
+        """date, market and listing count of every stored run"""
+        return self._read("SELECT date, market, COUNT(*) AS listings FROM listings GROUP BY date, market "
+                          "ORDER BY date, market", [])
+
+    def _read(self, sql: str, params: list) -> pd.DataFrame:
+        with self._lock:
+            cursor = self._db.execute(sql, params)
+            rows = cursor.fetchall()
+        return pd.DataFrame(rows, columns=[column[0] for column in cursor.description])
+
+    @staticmethod
+    def _where(min_price: Optional[float] = None, max_price: Optional[float] = None, not_null: List[str] = None,
+               **equals):
+        clauses, params = [], []
+        for column, value in equals.items():
+            if value is not None:
+                clauses.append(f"{column} = ?")
+                params.append(str(value))
+        if min_price is not None:
+            clauses.append("listed >= ?")
+            params.append(min_price)
+        if max_price is not None:
+            clauses.append("listed <= ?")
+            params.append(max_price)
+        clauses.extend(f"{column} IS NOT NULL" for column in not_null or [])
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
@@ -0,0 +1,106 @@
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+"""
+Request scheduling primitives used by Session
+>>> bucket = TokenBucket(rate=5, burst=10)
+>>> limiter = AdaptiveLimiter(initial=4, maximum=16)
+>>> bucket.acquire()
+>>> with limiter.slot(): ...
+>>> limiter.on_block()
+"""
+
+
+class TokenBucket:
+    """
+    Limits the average request rate while allowing short bursts, safe to share between threads
+    """
+
+    def __init__(self, rate: float, burst: int = 1, clock=time.monotonic, sleep=time.sleep):
+        """
+        :param rate: tokens added per second
+        :param burst: bucket capacity
+        :param clock: monotonic clock, injectable for testing
+        :param sleep: sleep function, injectable for testing
+        """
+        if rate <= 0 or burst < 1:
+            raise ValueError("rate must be positive and burst at least 1")
+        self.rate = rate
+        self.burst = burst
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = float(burst)
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """blocks until a token is available"""
+        while True:
+            with self._lock:
+                now = self._clock()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            self._sleep(wait)
+
+
+class AdaptiveLimiter:
+    """
+    AIMD concurrency window: grows by `increase` per window of successes, shrinks by `decrease` on a block
+    safe to share between threads
+    """
+
+    def __init__(self, initial: int = 4, minimum: int = 1, maximum: int = 16,
+                 increase: float = 1.0, decrease: float = 0.5):
+        """
+        :param initial: starting number of requests allowed in flight
+        :param minimum: floor of the window
+        :param maximum: ceiling of the window
+        :param increase: added to the window after a full window of successful requests
+        :param decrease: window multiplier when a request is blocked
+        """
+        if not 1 <= minimum <= initial <= maximum or not 0 < decrease < 1:
+            raise ValueError("expected 1 <= minimum <= initial <= maximum and 0 < decrease < 1")
+        self.minimum = minimum
+        self.maximum = maximum
+        self.increase = increase
+        self.decrease = decrease
+        self._limit = float(initial)
+        self._in_flight = 0
+        self._condition = threading.Condition()
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @contextmanager
+    def slot(self):
+        """blocks until fewer than `limit` requests are in flight"""
+        with self._condition:
+            self._condition.wait_for(lambda: self._in_flight < self.limit)
+            self._in_flight += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._in_flight -= 1
+                self._condition.notify_all()
+
+    def on_success(self):
+        with self._condition:
+            self._limit = min(self.maximum, self._limit + self.increase / self._limit)
+            self._condition.notify_all()
+
+    def on_block(self):
+        with self._condition:
+            self._limit = max(self.minimum, self._limit * self.decrease)
+
+
+def backoff_delay(attempt: int, base: float, cap: float, rand=random.random) -> float:
+    """full jitter exponential backoff, a random delay up to min(cap, base * 2^attempt)"""
+    return rand() * min(cap, base * 2 ** attempt)
@@ -0,0 +1,148 @@
+import json
+import logging
+import sqlite3
+import threading
+import time
+from typing import Callable, Iterable, Tuple
+
+from .file_util import mkdir
+
+log = logging.getLogger(__name__)
+
+"""
+>>> queue = WorkQueue("./data/results/20230101/columbus-queue.db")
+>>> Search("columbus", "ohio", queue=queue).get_all_listings()
+>>> queue.stats()
+"""
+
+# job kinds
+PAGE: str = "page"
+BUILDING: str = "building"
+UNIT: str = "unit"
+
+# job states
+PENDING: str = "pending"
+IN_FLIGHT: str = "in_flight"
+DONE: str = "done"
+FAILED: str = "failed"
+
+MAX_ATTEMPTS: int = 3  # runs that may attempt a failed job, retries within one run count once
+
+
+class WorkQueue:
+    """
+    Persistent SQLite job queue, a job is a (kind, key) pair such as ("unit", url)
+    finished jobs keep their JSON result so a rerun replays them instead of fetching again
+    safe to share between threads
+    """
+
+    def __init__(self, db_file: str, max_attempts: int = MAX_ATTEMPTS):
+        """
+        :param db_file: SQLite file, reuse the same file to resume a run
+        :param max_attempts: failed jobs are retried on later runs until this many runs attempted them
+        """
+        mkdir(db_file)
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        # jobs attempted by this run, only the first attempt of a run is counted
+        self._attempted = set()
+        self._db = sqlite3.connect(db_file, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS jobs (kind TEXT, key TEXT, state TEXT, attempts INTEGER, "
+                         "result TEXT, updated REAL, PRIMARY KEY (kind, key))")
+        # jobs in flight when the last run died never finished
+        interrupted = self._db.execute("UPDATE jobs SET state = ? WHERE state = ?", (PENDING, IN_FLIGHT)).rowcount
+        if interrupted:
+            log.info(f"Resuming {interrupted} interrupted jobs from {db_file}")
+
+    def add(self, kind: str, keys: Iterable):
+        """enqueues new jobs, existing jobs keep their state"""
+        now = time.time()
+        with self._lock:
+            self._db.executemany("INSERT OR IGNORE INTO jobs VALUES (?, ?, ?, 0, NULL, ?)",
+                                 [(kind, str(key), PENDING, now) for key in keys])
+
+    def get(self, kind: str, key) -> Tuple[bool, object]:
+        """
+        :return: (True, result) for a finished job, otherwise (False, None)
+        """
+        with self._lock:
+            row = self._db.execute("SELECT state, result FROM jobs WHERE kind = ? AND key = ?",
+                                   (kind, str(key))).fetchone()
+        if row and row[0] == DONE:
+            return True, json.loads(row[1])
+        return False, None
+
+    def start(self, kind: str, key):
+        with self._lock:
+            first = (kind, str(key)) not in self._attempted
+            self._attempted.add((kind, str(key)))
+        self._update(kind, key, IN_FLIGHT, attempt=1 if first else 0)
+
+    def finish(self, kind: str, key, result=None):
+        self._update(kind, key, DONE, result=json.dumps(result))
+
+    def fail(self, kind: str, key):
+        self._update(kind, key, FAILED)
+
+    def run(self, kind: str, key, func: Callable, *args):
+        """
+        Returns the stored result of a finished job, otherwise calls func(*args) and records the outcome
+        a None result or an exception marks the job failed, exceptions are re-raised
+        a job is skipped once max_attempts earlier runs failed it, retries within this run are not limited
+        """
+        done, result = self.get(kind, key)
+        if done:
+            return result
+        if not self.attempted(kind, key) and self.attempts(kind, key) >= self.max_attempts:
+            log.debug(f"Skipping {kind} {key} after {self.max_attempts} attempts")
+            return None
+        self.start(kind, key)
+        try:
+            result = func(*args)
+        except Exception:
+            self.fail(kind, key)
+            raise
+        if result is None:
+            self.fail(kind, key)
+        else:
+            self.finish(kind, key, result)
+        return result
+
+    def attempted(self, kind: str, key) -> bool:
+        """whether this run already attempted the job"""
+        with self._lock:
+            return (kind, str(key)) in self._attempted
+
+    def attempts(self, kind: str, key) -> int:
+        """runs that attempted the job"""
+        with self._lock:
+            row = self._db.execute("SELECT attempts FROM jobs WHERE kind = ? AND key = ?",
+                                   (kind, str(key))).fetchone()
+        return row[0] if row else 0
+
+    def stats(self):
+        """
+        :return: {kind: {state: count}}
+        """
+        with self._lock:
+            rows = self._db.execute("SELECT kind, state, COUNT(*) FROM jobs GROUP BY kind, state").fetchall()
+        stats = {}
+        for kind, state, count in rows:
+            stats.setdefault(kind, {})[state] = count
+        return stats
+
+    def _update(self, kind: str, key, state: str, attempt: int = 0, result: str = None):
+        with self._lock:
+            self._db.execute("INSERT INTO jobs VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (kind, key) DO UPDATE SET "
+                             "state = excluded.state, attempts = attempts + ?, "
+                             "result = COALESCE(excluded.result, result), updated = excluded.updated",
+                             (kind, str(key), state, attempt, result, time.time(), attempt))
+
+
+def run_queued(queue: WorkQueue, kind: str, key, func: Callable, *args):
+    """runs func(*args) through the queue when one is given"""
+    if queue is None:
+        return func(*args)
+    return queue.run(kind, key, func, *args)
@@ -1,26 +1,48 @@
+import gzip
+import json
 import logging
+import os
+from collections import namedtuple
+from functools import lru_cache
 from typing import List, Optional
 
-from uszipcode import SearchEngine, ZipcodeTypeEnum
+from .file_util import mkdir, file_exists
 
 log = logging.getLogger(__name__)
 
 """
 >>> fetch_zipcodes_info("columbus", "ohio", None)
 >>> fetch_zipcodes("columbus", "ohio", [43085])
+>>> lookup_zipcodes("columbus", "oh")
+>>> build_zipcode_index()
+uszipcode (and its SQLite DB) is only loaded when a city/state is missing from the local index
 """
 
+ZIPCODE_INDEX_FILE: str = "./data/zipcodes/index.json.gz"
 
-def fetch_zipcodes_info(city: str, state: str, zipcode_type: Optional[ZipcodeTypeEnum] = ZipcodeTypeEnum.Standard):
+# compact standard zipcode record kept in the index
+ZipcodeInfo = namedtuple("ZipcodeInfo", ["zipcode", "lat", "lng", "north", "south", "east", "west"])
+
+
+@lru_cache(maxsize=1)
+def search_engine():
+    """one SearchEngine per process, opening it loads the zipcode DB"""
+    from uszipcode import SearchEngine
+    return SearchEngine()
+
+
+def fetch_zipcodes_info(city: str, state: str, zipcode_type: Optional[str] = "Standard"):
     """
     Fetches zipcode info for a city/state, defaults to only STANDARD zipcodes
     :param city:
     :param state:
-    :param zipcode_type: set to None for all available zipcodes
+    :param zipcode_type: uszipcode ZipcodeTypeEnum or its name, set to None for all available zipcodes
     :return: list of SimpleZipcode objects
     """
-    search = SearchEngine()
-    zipcodes = search.by_city_and_state(city=city, state=state, returns=None, zipcode_type=zipcode_type)
+    from uszipcode import ZipcodeTypeEnum
+    if isinstance(zipcode_type, str):
+        zipcode_type = ZipcodeTypeEnum[zipcode_type]
+    zipcodes = search_engine().by_city_and_state(city=city, state=state, returns=None, zipcode_type=zipcode_type)
     z_type = zipcode_type.name if zipcode_type else 'total'
     log.debug(f"Found {len(zipcodes)} {z_type} zipcodes in {city.upper()}, {state.upper()}")
     return zipcodes
@@ -36,4 +58,72 @@ def fetch_zipcodes(city: str, state: str, exclude: List[int] = None):
     """
     if not exclude:
         exclude = []
-    return [int(zc.zipcode) for zc in fetch_zipcodes_info(city, state) if int(zc.zipcode) not in exclude]
+    return [zc.zipcode for zc in lookup_zipcodes(city, state) if zc.zipcode not in exclude]
+
+
+"""zipcode index"""
+
+
+def lookup_zipcodes(city: str, state: str, index_file: str = ZIPCODE_INDEX_FILE) -> List[ZipcodeInfo]:
+    """
+    Standard zipcodes for a city/state from the local index, a missing city/state is looked up once and added
+    :param city:
+    :param state: name or abbreviation
+    :param index_file: gzipped JSON index, see build_zipcode_index
+    :return: list of ZipcodeInfo
+    """
+    index = load_zipcode_index(index_file)
+    key = _index_key(city, state)
+    if key not in index:
+        index[key] = [_zipcode_info(zc) for zc in fetch_zipcodes_info(city, state)]
+        write_zipcode_index(index, index_file)
+    return [ZipcodeInfo(*zc) for zc in index[key]]
+
+
+@lru_cache(maxsize=None)
+def load_zipcode_index(index_file: str = ZIPCODE_INDEX_FILE) -> dict:
+    """
+    :return: {"city|state": [[zipcode, lat, lng, north, south, east, west], ...]}, read once per process
+    """
+    if not file_exists(index_file):
+        return {}
+    with gzip.open(index_file, 'rt') as f:
+        return json.load(f)
+
+
+def write_zipcode_index(index: dict, index_file: str = ZIPCODE_INDEX_FILE):
+    mkdir(index_file)
+    tmp_file = f"{index_file}.tmp"
+    with gzip.open(tmp_file, 'wt') as f:
+        json.dump(index, f, separators=(',', ':'))
+    os.replace(tmp_file, index_file)
+
+
+def build_zipcode_index(index_file: str = ZIPCODE_INDEX_FILE):
+    """
+    Indexes every standard zipcode in the uszipcode DB by major city and state (abbreviation and name)
+    :return: index dict, also written to index_file
+    """
+    from uszipcode.state_abbr import MAPPER_STATE_ABBR_SHORT_TO_LONG
+    built = {}
+    for state_abbr, state_name in MAPPER_STATE_ABBR_SHORT_TO_LONG.items():
+        for zc in search_engine().by_state(state_abbr, returns=None):
+            if not zc.major_city:
+                continue
+            info = _zipcode_info(zc)
+            for state_key in (state_abbr, state_name):
+                built.setdefault(_index_key(zc.major_city, state_key), []).append(info)
+    # keeps keys added by lookups, e.g. misspelled cities resolved by uszipcode's fuzzy matching
+    index = load_zipcode_index(index_file)
+    index.update(built)
+    write_zipcode_index(index, index_file)
+    log.info(f"Indexed {len(index)} city/state keys: {index_file}")
+    return index
+
+
+def _index_key(city: str, state: str):
+    return f"{city.strip().lower()}|{state.strip().lower()}"
+
+
+def _zipcode_info(zc) -> list:
+    return [int(zc.zipcode), zc.lat, zc.lng, zc.bounds_north, zc.bounds_south, zc.bounds_east, zc.bounds_west]